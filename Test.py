@@ -1,10 +1,22 @@
 import pygame
+import numpy as np
 import sys
+import os
+import time
+import struct
+import hashlib
+import argparse
+import functools
+import threading
+import zlib
+from collections import OrderedDict, deque
 
 # -------------- Config --------------
 WIDTH, HEIGHT = 960, 540
 TITLE = "Pygame Platformer Starter"
-FPS = 60
+FPS = 60  # render frame cap
+SIM_RATE = 60  # fixed simulation steps per second
+MAX_CATCH_UP_STEPS = 5  # sim steps per frame before a slow frame's backlog is dropped
 
 # World physics
 GRAVITY = 2000.0  # px/s^2
@@ -27,6 +39,19 @@ LADDER_COLOR = (150, 75, 0)
 MONSTER_COLOR = (255, 50, 50)
 ENEMY_SIZE = (36, 36)
 PROJECTILE_COLOR = (255, 100, 0)
+PROJECTILE_SIZE = 12
+PROJECTILE_SPEED = 300.0  # px/s along each axis
+PROJECTILE_POOL_SIZE = 512
+PROJECTILE_LIFETIME = 6.0  # seconds
+PROJECTILES_HIT_TERRAIN = True  # solid tiles despawn projectiles
+
+# Activity regions (see ActivityRegions): px beyond the screen edges
+ACTIVE_MARGIN = WIDTH // 2
+NEAR_MARGIN = WIDTH * 2
+NEAR_TICK_INTERVAL = 4  # steps between ticks in the near band
+# Below this many rows of a kind, running them all every step is cheaper
+# than working out which ones are due
+LOD_MIN_ROWS = 64
 POWERUP_COLOR = (147, 112, 219)
 FLAG_COLOR = (255, 215, 0)
 
@@ -105,9 +130,15 @@ LEVEL_MAP_3 = [
     "########################--##############################--------##################------##############################",
 ]
 
+LEVEL_MAPS = {1: LEVEL_MAP_1, 2: LEVEL_MAP_2, 3: LEVEL_MAP_3}
+
 TILE_SIZE = 48
+CHUNK_SIZE = TILE_SIZE * 8  # static terrain is pre-rendered in square chunks
+CHUNK_COLORKEY = (255, 0, 255)
+MAX_BAKED_CHUNKS = 128  # ~19 MB of chunk surfaces at 32 bpp
+CULL_MARGIN = 32  # px of slack around the view before an entity is skipped
 
-# Current level
+# Starting level
 current_level = 1
 
 
@@ -116,24 +147,236 @@ def rect_from_grid(x, y, w=1, h=1):
     return pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, w * TILE_SIZE, h * TILE_SIZE)
 
 
+def merge_solid_tiles(solid_mask):
+    # Greedy level compile step: join horizontal runs of solid tiles, then grow
+    # each run downwards while the row below has the exact same run.
+    # solid_mask is a 2D bool array (rows x cols).
+    # Returns rects in grid units as (x, y, w, h).
+    merged = []
+    open_runs = {}  # (x0, x1) -> [y0, h]
+    padded = np.zeros(solid_mask.shape[1] + 2, dtype=np.int8)
+    for y, row in enumerate(solid_mask):
+        padded[1:-1] = row
+        edges = np.diff(padded)
+        runs = zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist())
+
+        next_open = {}
+        for run in runs:
+            if run in open_runs:
+                open_runs[run][1] += 1
+                next_open[run] = open_runs.pop(run)
+            else:
+                next_open[run] = [y, 1]
+        for (x0, x1), (y0, h) in open_runs.items():
+            merged.append((x0, y0, x1 - x0, h))
+        open_runs = next_open
+
+    for (x0, x1), (y0, h) in open_runs.items():
+        merged.append((x0, y0, x1 - x0, h))
+    return merged
+
+
+# -------------- Collision grid --------------
+class CollisionGrid:
+    # Buckets solids by the tile cells they overlap so collision checks only
+    # look at what is near the player instead of the whole level.
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+
+    def add(self, solid):
+        # Remember insertion order so queries come back in the same order as
+        # the original solids list (collision resolution depends on it)
+        order = self.count
+        self.count += 1
+        cs = self.cell_size
+        r = solid.rect
+        for cy in range(r.top // cs, (r.bottom - 1) // cs + 1):
+            for cx in range(r.left // cs, (r.right - 1) // cs + 1):
+                self.cells.setdefault((cx, cy), []).append((order, solid))
+
+    def query(self, rect):
+        cs = self.cell_size
+        get = self.cells.get
+        x0, x1 = rect.left // cs, (rect.right - 1) // cs + 1
+        found = {}
+        for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+            for cx in range(x0, x1):
+                bucket = get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        if len(found) < 2:
+            return list(found.values())
+        return [found[k] for k in sorted(found)]
+
+
+def first_crossed(old_rect, dx, dy, solids):
+    # Swept AABB along one axis: the nearest non-ladder solid whose near face
+    # old_rect's leading edge crosses when moving by (dx, 0) or (0, dy).
+    # Catches tiles the mover skipped over entirely in one big step.
+    hit = None
+    for s in solids:
+        r = s.rect
+        if s.is_ladder:
+            continue
+        if dx:
+            if r.top >= old_rect.bottom or r.bottom <= old_rect.top:
+                continue
+            if dx > 0 and old_rect.right <= r.left < old_rect.right + dx:
+                if hit is None or r.left < hit.rect.left:
+                    hit = s
+            elif dx < 0 and old_rect.left + dx < r.right <= old_rect.left:
+                if hit is None or r.right > hit.rect.right:
+                    hit = s
+        elif dy:
+            if r.left >= old_rect.right or r.right <= old_rect.left:
+                continue
+            if dy > 0 and old_rect.bottom <= r.top < old_rect.bottom + dy:
+                if hit is None or r.top < hit.rect.top:
+                    hit = s
+            elif dy < 0 and old_rect.top + dy < r.bottom <= old_rect.top:
+                if hit is None or r.bottom > hit.rect.bottom:
+                    hit = s
+    return hit
+
+
+# -------------- Broadphase --------------
+# Layer bits for Broadphase entries, OR them together to query several kinds
+LAYER_POWERUP = 1
+LAYER_ENEMY = 2
+LAYER_SHOOTER = 4
+LAYER_SPIKE = 8
+LAYER_FLAG = 16
+LAYER_PROJECTILE = 32
+LAYER_ALL = 63
+BROADPHASE_CELL = TILE_SIZE * 2
+
+
+class Broadphase:
+    # Uniform grid over every non-terrain entity, so player contact checks
+    # only look at what shares a cell with the player. Entries are
+    # (layer, handle) keys: the index into the layer's object list for
+    # entities with a rect, or the row for the array-backed enemies and
+    # projectiles. Array layers are re-synced after they move, and only rows
+    # whose cell range changed touch the buckets.
+    def __init__(self, cell_size=BROADPHASE_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.objects = {}  # layer -> entities, indexed by handle
+        self.spans = {}  # layer -> (rows, 4) cell ranges of an array layer
+
+    def _span(self, rect):
+        cs = self.cell_size
+        return rect.left // cs, rect.top // cs, (rect.right - 1) // cs, (rect.bottom - 1) // cs
+
+    def _insert(self, key, span):
+        x0, y0, x1, y1 = span
+        cells = self.cells
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[cx, cy] = {key}
+                else:
+                    bucket.add(key)
+
+    def _discard(self, key, span):
+        x0, y0, x1, y1 = span
+        cells = self.cells
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                bucket = cells[cx, cy]
+                bucket.discard(key)
+                if not bucket:
+                    del cells[cx, cy]
+
+    def add_objects(self, layer, objects):
+        self.objects[layer] = list(objects)
+        for handle, obj in enumerate(self.objects[layer]):
+            self._insert((layer, handle), self._span(obj.rect))
+
+    def insert_object(self, layer, handle):
+        # Put back an object taken out with remove_object()
+        self._insert((layer, handle), self._span(self.objects[layer][handle].rect))
+
+    def remove_object(self, layer, handle):
+        self._discard((layer, handle), self._span(self.objects[layer][handle].rect))
+
+    def sync_array(self, layer, pos, size, alive=None, rows=None):
+        # pos: (n, 2) top-left positions, row i is handle i. Rows that are
+        # False in alive get no entries. rows: only these rows moved, were
+        # added or removed since the last sync (the layer must have been
+        # synced in full before).
+        if rows is not None:
+            span = self.spans[layer]
+            old = span[rows]
+            new = np.empty_like(old)
+            self._fill_spans(new, pos[rows], size)
+            if alive is not None:
+                new[~alive[rows]] = (0, 0, -1, -1)
+            for i in np.flatnonzero((new != old).any(axis=1)).tolist():
+                key = (layer, int(rows[i]))
+                self._discard(key, old[i].tolist())
+                self._insert(key, new[i].tolist())
+            span[rows] = new
+            return
+
+        n = len(pos)
+        span = np.empty((n, 4), dtype=np.int64)
+        self._fill_spans(span, pos, size)
+        if alive is not None:
+            span[~alive] = (0, 0, -1, -1)  # empty cell range
+        old = self.spans.get(layer, span[:0])
+        m = len(old)
+        k = min(n, m)
+        for i in np.flatnonzero((span[:k] != old[:k]).any(axis=1)).tolist():
+            self._discard((layer, i), old[i].tolist())
+            self._insert((layer, i), span[i].tolist())
+        for i in range(k, m):
+            self._discard((layer, i), old[i].tolist())
+        for i in range(k, n):
+            self._insert((layer, i), span[i].tolist())
+        self.spans[layer] = span
+
+    def _fill_spans(self, span, pos, size):
+        cs = self.cell_size
+        span[:, :2] = pos // cs
+        span[:, 2] = (pos[:, 0] + size[0]) // cs
+        span[:, 3] = (pos[:, 1] + size[1]) // cs
+
+    def query(self, rect, mask=LAYER_ALL):
+        # {layer: sorted handles} for every entry sharing a cell with rect.
+        # These are candidates, callers still do the exact overlap test.
+        cs = self.cell_size
+        get = self.cells.get
+        x0, x1 = rect.left // cs, (rect.right - 1) // cs + 1
+        found = {}
+        for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+            for cx in range(x0, x1):
+                bucket = get((cx, cy))
+                if bucket:
+                    for layer, handle in bucket:
+                        if layer & mask:
+                            found.setdefault(layer, set()).add(handle)
+        return {layer: sorted(handles) for layer, handles in found.items()}
+
+
 # -------------- Game Objects --------------
-class Platform(pygame.sprite.Sprite):
+# Level entities are plain classes with __slots__: nothing is ever put in a
+# sprite Group, and big levels build hundreds of thousands of them.
+class Platform:
+    __slots__ = ("rect", "is_ladder")
+
     def __init__(self, rect, is_ladder=False):
-        super().__init__()
         self.rect = rect
         self.is_ladder = is_ladder
 
-    def draw(self, surf, camera):
-        r = self.rect.move(-camera.x, -camera.y)
-        if not self.is_ladder:
-            pygame.draw.rect(surf, PLATFORM_COLOR, r, border_radius=6)
-        else:
-            pygame.draw.rect(surf, LADDER_COLOR, r, border_radius=6)
 
+class Spike:
+    __slots__ = ("rect",)
 
-class Spike(pygame.sprite.Sprite):
     def __init__(self, rect):
-        super().__init__()
         # Double the width of the hitbox to cover both spikes
         self.rect = pygame.Rect(rect.x, rect.y, rect.width * 2, rect.height)
 
@@ -160,9 +403,10 @@ class Spike(pygame.sprite.Sprite):
         pygame.draw.polygon(surf, (255, 255, 100), points2)
 
 
-class Enemy(pygame.sprite.Sprite):
+class Enemy:
+    __slots__ = ("rect",)
+
     def __init__(self, pos):
-        super().__init__()
         self.rect = pygame.Rect(pos[0], pos[1], *ENEMY_SIZE)
 
     def draw(self, surf, camera):
@@ -170,9 +414,24 @@ class Enemy(pygame.sprite.Sprite):
         pygame.draw.rect(surf, MONSTER_COLOR, r, border_radius=6)
 
 
-class ShootingEnemy(pygame.sprite.Sprite):
+@functools.lru_cache(maxsize=64)
+def shot_timer_steps(interval, dt):
+    # The shoot_timer values a ShootingEnemy steps through between shots at
+    # a fixed dt, summed the same way update() does so float rounding (and
+    # so the step a shot lands on) matches exactly
+    timers = [0]
+    t = 0
+    while True:
+        t += dt
+        if t >= interval:
+            return tuple(timers)
+        timers.append(t)
+
+
+class ShootingEnemy:
+    __slots__ = ("rect", "direction", "shoot_timer", "shoot_interval")
+
     def __init__(self, pos, direction):
-        super().__init__()
         self.rect = pygame.Rect(pos[0], pos[1], *ENEMY_SIZE)
         self.direction = direction  # 1 for down-right, -1 for down-left
         self.shoot_timer = 0
@@ -184,33 +443,50 @@ class ShootingEnemy(pygame.sprite.Sprite):
             self.shoot_timer = 0
             proj_x = self.rect.centerx
             proj_y = self.rect.centery
-            projectiles.append(Projectile((proj_x, proj_y), self.direction))
+            projectiles.spawn(proj_x, proj_y, self.direction)
+
+    def catch_up(self, steps, dt, projectiles, tiles=None):
+        # Replay `steps` skipped steps of size dt at once. The timer counts
+        # whole steps and restarts at 0 on every shot; a shot fired k steps
+        # ago is spawned already moved k steps along its path (this step's
+        # projectile update adds the last one), unless it has expired or,
+        # with tiles, its path so far crossed a solid tile.
+        if dt <= 0:
+            return
+        timers = shot_timer_steps(self.shoot_interval, dt)
+        per_shot = len(timers)
+        phase = int(round(self.shoot_timer / dt)) % per_shot
+        oldest = steps + 1 - int(projectiles.lifetime / dt)
+        k = per_shot - phase
+        if k < oldest:
+            k += (oldest - k + per_shot - 1) // per_shot * per_shot
+        center = np.array(self.rect.center, dtype=float) + PROJECTILE_SIZE // 2  # of a new shot
+        vel = np.array((PROJECTILE_SPEED * self.direction, PROJECTILE_SPEED))
+        for k in range(k, steps + 1, per_shot):
+            age = (steps - k + 1) * dt
+            if tiles is not None:
+                if path_hits_terrain(center[None], (center + vel * age)[None], tiles)[0]:
+                    continue
+            i = projectiles.spawn(self.rect.centerx, self.rect.centery, self.direction)
+            if i is not None:
+                projectiles.pos[i] += projectiles.vel[i] * age
+                projectiles.age[i] = age
+        self.shoot_timer = timers[(phase + steps) % per_shot]
 
     def draw(self, surf, camera):
         r = self.rect.move(-camera.x, -camera.y)
         pygame.draw.rect(surf, (255, 150, 0), r, border_radius=6)
 
-class PatrolEnemy(pygame.sprite.Sprite):
+class PatrolEnemy:
+    __slots__ = ("rect", "start_x", "patrol_distance", "speed", "direction")
+
     def __init__(self, pos, patrol_distance=300, speed=120):
-        super().__init__()
         self.rect = pygame.Rect(pos[0], pos[1], *ENEMY_SIZE)
         self.start_x = pos[0]
         self.patrol_distance = patrol_distance
         self.speed = speed
         self.direction = 1  # 1 = right, -1 = left
 
-    def update(self, dt):
-        # Move left and right within the patrol range
-        self.rect.x += self.direction * self.speed * dt
-
-        # Reverse direction if reached patrol boundaries
-        if self.rect.x > self.start_x + self.patrol_distance:
-            self.rect.x = self.start_x + self.patrol_distance
-            self.direction = -1
-        elif self.rect.x < self.start_x:
-            self.rect.x = self.start_x
-            self.direction = 1
-
     def draw(self, surf, camera):
         r = self.rect.move(-camera.x, -camera.y)
         color = (200, 80, 80)
@@ -218,25 +494,284 @@ class PatrolEnemy(pygame.sprite.Sprite):
 
 
 
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, pos, direction):
-        super().__init__()
-        self.rect = pygame.Rect(pos[0], pos[1], 12, 12)
-        self.direction = direction
-        self.speed = 300  # pixels per second
+@functools.lru_cache(maxsize=4096)
+def patrol_cycle(start_x, distance, speed, dt):
+    # The x positions a patrol steps through in one full cycle at a fixed
+    # dt, from start_x heading right, summed with the same float operations
+    # as EnemyBatch.update() so a catch-up lands exactly where stepping
+    # would. Returns (xs, turn): xs[i] is x after i steps, heading left
+    # from index turn on.
+    end_x = start_x + distance
+    xs = [start_x]
+    x = start_x
+    while True:
+        x = x + 1.0 * speed * dt
+        if x > end_x:
+            break
+        xs.append(x)
+    turn = len(xs)
+    x = end_x
+    while x >= start_x:
+        xs.append(x)
+        x = x + -1.0 * speed * dt
+    xs = np.array(xs)
+    xs.flags.writeable = False
+    return xs, turn
+
+
+class EnemyBatch:
+    # Every contact enemy ('E' and 'C') in flat arrays so patrols and player
+    # contact are a few array operations per frame. Static enemies are
+    # patrol enemies with zero speed and distance. Positions are floats:
+    # the old per-enemy rect.x dropped the fraction every step, so when
+    # speed * dt wasn't a whole number patrols ran slower than `speed`
+    # (or, moving right at 144 Hz, not at all).
+    def __init__(self, enemies):
+        n = len(enemies)
+        self.count = n
+        self.pos = np.array([e.rect.topleft for e in enemies], dtype=float).reshape(n, 2)
+        self.patrol = np.array([isinstance(e, PatrolEnemy) for e in enemies], dtype=bool)
+        self.start_x = np.array([getattr(e, "start_x", e.rect.x) for e in enemies], dtype=float)
+        self.patrol_distance = np.array([getattr(e, "patrol_distance", 0) for e in enemies], dtype=float)
+        self.speed = np.array([getattr(e, "speed", 0) for e in enemies], dtype=float)
+        self.direction = np.array([getattr(e, "direction", 1) for e in enemies], dtype=float)
+
+    def __len__(self):
+        return self.count
+
+    def update(self, dt, rows=None):
+        # One patrol step for every enemy, or just for rows
+        rows = slice(None) if rows is None else rows
+        start_x = self.start_x[rows]
+        direction = self.direction[rows]
+        x = self.pos[rows, 0] + direction * self.speed[rows] * dt
+
+        # Reverse direction at the patrol boundaries
+        end_x = start_x + self.patrol_distance[rows]
+        past_end = x > end_x
+        x[past_end] = end_x[past_end]
+        direction[past_end] = -1
+        before_start = x < start_x
+        x[before_start] = start_x[before_start]
+        direction[before_start] = 1
+        self.pos[rows, 0] = x
+        self.direction[rows] = direction
+
+    def advance(self, rows, steps, dt):
+        # Catch-up for rows that skipped steps: the same as running
+        # update(dt) `steps` (per row) times. With a fixed dt a patrol is
+        # periodic, so look up where the row is in its patrol_cycle() and
+        # jump ahead in it.
+        for row, n in zip(rows.tolist(), steps.tolist()):
+            distance, speed = self.patrol_distance[row], self.speed[row]
+            if distance <= 0 or speed <= 0:
+                continue  # static enemies never move
+            xs, turn = patrol_cycle(float(self.start_x[row]), float(distance), float(speed), dt)
+            x = self.pos[row, 0]
+            if self.direction[row] > 0:
+                i = int(np.searchsorted(xs[:turn], x))
+            else:
+                i = turn + int(np.searchsorted(-xs[turn:], -x))
+            if i >= len(xs) or xs[i] != x or (i < turn) != (self.direction[row] > 0):
+                # Not on the cycle for this dt (dt changed), so step it out
+                for _ in range(n):
+                    self.update(dt, [row])
+                continue
+            i = (i + n) % len(xs)
+            self.pos[row, 0] = xs[i]
+            self.direction[row] = 1 if i < turn else -1
+
+    def overlaps(self, rect, rows=None):
+        # Bool mask over all enemies, or over `rows` (sorted indices) if given
+        p = self.pos if rows is None else self.pos[rows]
+        return ((p[:, 0] < rect.right) & (p[:, 0] + ENEMY_SIZE[0] > rect.left) &
+                (p[:, 1] < rect.bottom) & (p[:, 1] + ENEMY_SIZE[1] > rect.top))
+
+    def contact(self, rect, rows=None):
+        # Index of the first enemy touching rect and the knockback direction
+        # away from it, or None if nothing touches. rows limits the check to
+        # broadphase candidates.
+        hits = self.overlaps(rect, rows)
+        if not hits.any():
+            return None
+        i = int(hits.argmax())
+        if rows is not None:
+            i = rows[i]
+        knock_dir = 1 if rect.centerx < self.pos[i, 0] + ENEMY_SIZE[0] // 2 else -1
+        return i, knock_dir
+
+    def queue_sprites(self, batch, camera, view, stats, sprites):
+        p = self.pos
+        visible = ((p[:, 0] < view.right) & (p[:, 0] + ENEMY_SIZE[0] > view.left) &
+                   (p[:, 1] < view.bottom) & (p[:, 1] + ENEMY_SIZE[1] > view.top))
+        cam_x, cam_y = int(camera.x), int(camera.y)
+        for i in np.flatnonzero(visible):
+            sprite = sprites.patrol_enemy if self.patrol[i] else sprites.enemy
+            batch.append((sprite, (int(p[i, 0]) - cam_x, int(p[i, 1]) - cam_y)))
+        drawn = int(visible.sum())
+        stats.drawn += drawn
+        stats.culled += self.count - drawn
+
+
+def path_hits_terrain(start, end, tiles):
+    # Whether each straight path start -> end (rows of x, y in px) passes
+    # through a solid tile. Points along it are tested at most half a
+    # projectile apart, so a fast shot or a long step can't skip a wall.
+    d = end - start
+    samples = int(np.abs(d).max(initial=0) // (PROJECTILE_SIZE // 2)) + 1
+    t = np.arange(1, samples + 1) / samples
+    points = start[:, None, :] + d[:, None, :] * t[:, None]
+    cell = (points // TILE_SIZE).astype(np.intp)
+    tx, ty = cell[..., 0], cell[..., 1]
+    rows, cols = tiles.shape
+    inside = (tx >= 0) & (tx < cols) & (ty >= 0) & (ty < rows)
+    solid = np.zeros(inside.shape, dtype=bool)
+    solid[inside] = tiles[ty[inside], tx[inside]] == TILE_SOLID
+    return solid.any(axis=1)
+
+
+def swept_hits(start, d, lo, hi):
+    # Ray vs slab test: does the path start -> start + d (rows of x, y)
+    # pass through the open box lo..hi? lo and hi broadcast against start,
+    # so every row can have its own box.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0 = (lo - start) / d
+        t1 = (hi - start) / d
+    # An axis without motion is inside its slab for every t, or never
+    still = d == 0
+    inside = (start > lo) & (start < hi)
+    t_near = np.where(still, np.where(inside, -np.inf, np.inf), np.minimum(t0, t1))
+    t_far = np.where(still, np.where(inside, np.inf, -np.inf), np.maximum(t0, t1))
+    enter = t_near.max(axis=1)
+    leave = t_far.min(axis=1)
+    return (enter < leave) & (enter < 1) & (leave > 0)
+
+
+class ProjectileSystem:
+    # Fixed-capacity pool of structure-of-arrays slots. Spawning takes a slot
+    # from the free list and despawning gives it back, so nothing is
+    # allocated while playing and a projectile keeps its slot (its handle in
+    # the broadphase) for its whole life. Positions are floats so slow
+    # projectiles don't lose sub-pixel movement.
+    def __init__(self, capacity=PROJECTILE_POOL_SIZE, lifetime=PROJECTILE_LIFETIME):
+        self.capacity = capacity
+        self.lifetime = lifetime
+        self.pos = np.zeros((capacity, 2))  # top-left x, y
+        self.vel = np.zeros((capacity, 2))
+        self.direction = np.zeros(capacity, dtype=np.int8)  # 1 down-right, -1 down-left
+        self.age = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))  # pop() hands out low slots first
+        self.count = 0
+        # Session stats, kept across clear()
+        self.peak = 0
+        self.spawned = 0
+        self.dropped = 0  # shots lost because every slot was taken
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.alive[:] = False
+        self.vel[:] = 0
+        self.free = list(range(self.capacity - 1, -1, -1))
+        self.count = 0
+
+    def view(self, start, stop):
+        # A pool over slots start:stop sharing this pool's arrays, with its
+        # own free list. Updating this pool moves every view's projectiles.
+        pool = ProjectileSystem(0, self.lifetime)
+        pool.capacity = stop - start
+        pool.pos = self.pos[start:stop]
+        pool.vel = self.vel[start:stop]
+        pool.direction = self.direction[start:stop]
+        pool.age = self.age[start:stop]
+        pool.alive = self.alive[start:stop]
+        pool.clear()
+        return pool
+
+    def spawn(self, x, y, direction, speed=PROJECTILE_SPEED):
+        if not self.free:
+            self.dropped += 1
+            return None
+        i = self.free.pop()
+        self.pos[i] = (x, y)
+        self.vel[i] = (speed * direction, speed)  # always move down
+        self.direction[i] = direction
+        self.age[i] = 0
+        self.alive[i] = True
+        self.count += 1
+        self.spawned += 1
+        self.peak = max(self.peak, self.count)
+        return i
 
     def update(self, dt):
-        self.rect.x += self.speed * self.direction * dt
-        self.rect.y += self.speed * dt  # always move down
-
-    def draw(self, surf, camera):
-        r = self.rect.move(-camera.x, -camera.y)
-        pygame.draw.circle(surf, PROJECTILE_COLOR, r.center, 6)
+        # Free slots have zero velocity, so the whole pool moves at once
+        self.pos += self.vel * dt
+        self.age += dt
+
+    def expired(self, world_w, world_h, tiles=None, dt=0.0):
+        # Live slots that outlived their lifetime or left the world, and with
+        # tiles (a level's tile grid) the ones whose center crossed a solid
+        # tile during the update(dt) that just ran
+        p = self.pos
+        gone = ((self.age >= self.lifetime) |
+                (p[:, 0] + PROJECTILE_SIZE < 0) | (p[:, 0] > world_w) |
+                (p[:, 1] + PROJECTILE_SIZE < 0) | (p[:, 1] > world_h))
+        live = np.flatnonzero(self.alive)
+        if tiles is not None and len(live):
+            end = p[live] + PROJECTILE_SIZE // 2
+            gone[live] |= path_hits_terrain(end - self.vel[live] * dt, end, tiles)
+        return gone & self.alive
+
+    def overlaps(self, rect):
+        # Batch AABB test, returns a bool mask over the slots
+        p = self.pos
+        return self.alive & ((p[:, 0] < rect.right) & (p[:, 0] + PROJECTILE_SIZE > rect.left) &
+                             (p[:, 1] < rect.bottom) & (p[:, 1] + PROJECTILE_SIZE > rect.top))
+
+    def swept_overlaps(self, rect, dt, moved=(0, 0), rows=None):
+        # Continuous version of overlaps() for the update(dt) that just ran:
+        # a ray vs slab test of each projectile's path, relative to rect
+        # (which moved by `moved` this step), against rect grown by the
+        # projectile size, so fast projectiles or long steps can't pass
+        # through rect between two positions. The mask is over all slots,
+        # or over rows (live slot indices) if given.
+        if rows is None:
+            return self.alive & self.swept_overlaps(rect, dt, moved, slice(None))
+        d = self.vel[rows] * dt - moved
+        lo = np.array((rect.left - PROJECTILE_SIZE, rect.top - PROJECTILE_SIZE), dtype=float)
+        hi = np.array((rect.right, rect.bottom), dtype=float)
+        return swept_hits(self.pos[rows] - d, d, lo, hi)
+
+    def remove(self, mask):
+        # Free every live slot set in mask, returns the freed slots
+        slots = np.flatnonzero(mask & self.alive)
+        if not len(slots):
+            return slots
+        self.alive[slots] = False
+        self.vel[slots] = 0
+        self.free.extend(slots[::-1].tolist())
+        self.count -= len(slots)
+        return slots
+
+    def queue_sprites(self, batch, camera, view, stats, sprites):
+        n = self.count
+        p = self.pos[self.alive]
+        visible = ((p[:, 0] < view.right) & (p[:, 0] + PROJECTILE_SIZE > view.left) &
+                   (p[:, 1] < view.bottom) & (p[:, 1] + PROJECTILE_SIZE > view.top))
+        cam_x, cam_y = int(camera.x), int(camera.y)
+        sprite = sprites.projectile
+        batch.extend((sprite, (int(x) - cam_x, int(y) - cam_y)) for x, y in p[visible])
+        drawn = int(visible.sum())
+        stats.drawn += drawn
+        stats.culled += n - drawn
+
+
+class Powerup:
+    __slots__ = ("rect", "type")
 
-
-class Powerup(pygame.sprite.Sprite):
     def __init__(self, rect, type="double"):
-        super().__init__()
         self.rect = rect
         self.type = type
 
@@ -252,9 +787,10 @@ class Powerup(pygame.sprite.Sprite):
         pygame.draw.ellipse(surf, color, r)
 
 
-class Flag(pygame.sprite.Sprite):
+class Flag:
+    __slots__ = ("rect",)
+
     def __init__(self, rect):
-        super().__init__()
         self.rect = rect
 
     def draw(self, surf, camera):
@@ -296,7 +832,8 @@ class Player(pygame.sprite.Sprite):
         self.health = self.max_health
         self.invuln_timer = 0
 
-    def update(self, dt, solids, input_dir, jump_pressed, shrink_pressed):
+    def update(self, dt, level, input_dir, jump_pressed, shrink_pressed, up=False, down=False):
+        grid = level.grid
         if self.invuln_timer > 0:
             self.invuln_timer -= dt
 
@@ -320,7 +857,7 @@ class Player(pygame.sprite.Sprite):
                 self.rect.bottom = old_bottom
 
                 # Check if player is now stuck inside a solid block
-                for s in solids:
+                for s in grid.query(self.rect):
                     if self.rect.colliderect(s.rect) and not s.is_ladder:
                         # Player grew inside a block - teleport to start
                         self.rect.x = self.start_pos[0]
@@ -332,7 +869,7 @@ class Player(pygame.sprite.Sprite):
 
         # Ladder detection
         probe = self.rect.inflate(-10, 0)
-        ladder = next((s for s in solids if getattr(s, "is_ladder", False) and probe.colliderect(s.rect)), None)
+        ladder = next((s for s in grid.query(probe) if getattr(s, "is_ladder", False) and probe.colliderect(s.rect)), None)
 
         # ---- Horizontal movement
         target_speed = MOVE_SPEED * input_dir
@@ -349,11 +886,6 @@ class Player(pygame.sprite.Sprite):
         if input_dir != 0:
             self.facing = 1 if input_dir > 0 else -1
 
-        # Read keys for ladder up/down
-        keys = pygame.key.get_pressed()
-        up = keys[pygame.K_UP] or keys[pygame.K_w]
-        down = keys[pygame.K_DOWN] or keys[pygame.K_s]
-
         # ---- Ladder behavior
         if ladder and (up or down):
             self.is_colliding_ladder = True
@@ -393,27 +925,40 @@ class Player(pygame.sprite.Sprite):
         self.on_ground = False
 
         # X axis
-        self.rect.x += round(self.vel.x * dt)
-        for s in solids:
-            if self.rect.colliderect(s.rect) and not s.is_ladder:
-                if self.vel.x > 0:
-                    self.rect.right = s.rect.left
-                elif self.vel.x < 0:
-                    self.rect.left = s.rect.right
-                self.vel.x = 0
+        # Query the swept area (plus a tile of slack for push-back) so every
+        # solid the old full scan could have hit is still considered
+        old_rect = self.rect.copy()
+        dx = round(self.vel.x * dt)
+        self.rect.x += dx
+        nearby = grid.query(self.rect.union(old_rect).inflate(TILE_SIZE * 2, 0))
+        # A solid crossed on the way counts as a collision even if the move
+        # jumped clean past it (big dt or high speed). Of everything hit, the
+        # player stops at the one it reaches first, whatever the list order.
+        crossed = first_crossed(old_rect, dx, 0, nearby)
+        hits = [s.rect for s in nearby if (s is crossed or self.rect.colliderect(s.rect)) and not s.is_ladder]
+        if hits:
+            if self.vel.x > 0:
+                self.rect.right = min(r.left for r in hits)
+            elif self.vel.x < 0:
+                self.rect.left = max(r.right for r in hits)
+            self.vel.x = 0
 
         # Y axis
-        self.rect.y += round(self.vel.y * dt)
-        for s in solids:
-            if self.rect.colliderect(s.rect) and not s.is_ladder:
-                if self.vel.y > 0:
-                    self.rect.bottom = s.rect.top
-                    self.on_ground = True
-                    self.vel.y = 0
-                    self.has_double_jump = self.can_double_jump
-                elif self.vel.y < 0:
-                    self.rect.top = s.rect.bottom
-                    self.vel.y = 0
+        old_rect = self.rect.copy()
+        dy = round(self.vel.y * dt)
+        self.rect.y += dy
+        nearby = grid.query(self.rect.union(old_rect).inflate(0, TILE_SIZE * 2))
+        crossed = first_crossed(old_rect, 0, dy, nearby)
+        hits = [s.rect for s in nearby if (s is crossed or self.rect.colliderect(s.rect)) and not s.is_ladder]
+        if hits:
+            if self.vel.y > 0:
+                self.rect.bottom = min(r.top for r in hits)
+                self.on_ground = True
+                self.vel.y = 0
+                self.has_double_jump = self.can_double_jump
+            elif self.vel.y < 0:
+                self.rect.top = max(r.bottom for r in hits)
+                self.vel.y = 0
 
         # Fall damage
         if self.on_ground:
@@ -428,16 +973,7 @@ class Player(pygame.sprite.Sprite):
                 self.last_y = self.rect.y
 
         # Boundary clamping
-        if current_level == 1:
-            level_map = LEVEL_MAP_1
-        elif current_level == 2:
-            level_map = LEVEL_MAP_2
-        elif current_level == 3:
-            level_map = LEVEL_MAP_3
-        else:
-            level_map = LEVEL_MAP_1
-        world_w = max(len(row) for row in level_map) * TILE_SIZE
-        world_h = len(level_map) * TILE_SIZE
+        world_w, world_h = level.world_w, level.world_h
 
         if self.rect.left < 0:
             self.rect.left = 0
@@ -476,13 +1012,91 @@ class Player(pygame.sprite.Sprite):
         pygame.draw.rect(surf, ACCENT, (eye_x, y, eye_w, eye_h), border_radius=2)
 
 
+# -------------- Static tile layer --------------
+class StaticLayer:
+    # Terrain never changes, so rasterize platforms and ladders into chunk
+    # surfaces and only blit the chunks the camera can see. Chunks are baked
+    # from the compiled tile grid; small levels bake everything up front, huge
+    # ones bake on first sight and keep at most max_chunks surfaces around.
+    def __init__(self, tiles, chunk_size=CHUNK_SIZE, max_chunks=MAX_BAKED_CHUNKS, convert=True):
+        self.tiles = tiles
+        self.convert = convert  # off when baking on a worker thread, see convert_chunks()
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+
+        # Which chunks have any terrain in them at all
+        per = chunk_size // TILE_SIZE
+        rows, cols = tiles.shape
+        terrain = np.zeros((-(-rows // per) * per, -(-cols // per) * per), dtype=bool)
+        terrain[:rows, :cols] = (tiles == TILE_SOLID) | (tiles == TILE_LADDER)
+        self.occupied = terrain.reshape(terrain.shape[0] // per, per, terrain.shape[1] // per, per).any(axis=(1, 3))
+
+        if self.occupied.sum() <= max_chunks:
+            for cy, cx in np.argwhere(self.occupied).tolist():
+                self.chunks[(cx, cy)] = self._bake(cx, cy)
+
+    def _bake(self, cx, cy):
+        per = self.chunk_size // TILE_SIZE
+        chunk = pygame.Surface((self.chunk_size, self.chunk_size))
+        chunk.fill(CHUNK_COLORKEY)
+        chunk.set_colorkey(CHUNK_COLORKEY)
+        block = self.tiles[cy * per:(cy + 1) * per, cx * per:(cx + 1) * per]
+        for ty, tx in np.argwhere((block == TILE_SOLID) | (block == TILE_LADDER)).tolist():
+            color = LADDER_COLOR if block[ty, tx] == TILE_LADDER else PLATFORM_COLOR
+            local = (tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            pygame.draw.rect(chunk, color, local, border_radius=6)
+
+        # Match the display format so blits stay cheap
+        if self.convert and pygame.display.get_surface() is not None:
+            chunk = chunk.convert()
+        return chunk
+
+    def convert_chunks(self):
+        # Convert chunks baked off the main thread, then convert as they bake.
+        # Chunks already in the display's pixel format are left alone since a
+        # convert would only cost a copy.
+        self.convert = True
+        display = pygame.display.get_surface()
+        if display is not None:
+            fmt = (display.get_bitsize(), display.get_masks())
+            for key, chunk in self.chunks.items():
+                if (chunk.get_bitsize(), chunk.get_masks()) != fmt:
+                    self.chunks[key] = chunk.convert()
+
+    def get_chunk(self, cx, cy):
+        rows, cols = self.occupied.shape
+        if not (0 <= cy < rows and 0 <= cx < cols and self.occupied[cy, cx]):
+            return None
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = self._bake(cx, cy)
+            if len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def draw(self, surf, camera):
+        # Only the chunks under surf's clip rect (all of surf when unclipped)
+        cs = self.chunk_size
+        cam_x, cam_y = int(camera.x), int(camera.y)
+        clip = surf.get_clip()
+        for cy in range((cam_y + clip.top) // cs, (cam_y + clip.bottom - 1) // cs + 1):
+            for cx in range((cam_x + clip.left) // cs, (cam_x + clip.right - 1) // cs + 1):
+                chunk = self.get_chunk(cx, cy)
+                if chunk is not None:
+                    surf.blit(chunk, (cx * cs - cam_x, cy * cs - cam_y))
+
+
 # -------------- Camera --------------
 class Camera:
     def __init__(self):
         self.x = 0
         self.y = 0
 
-    def update(self, target_rect):
+    def update(self, target_rect, level):
         margin_x, margin_y = WIDTH * 0.35, HEIGHT * 0.4
         if target_rect.centerx - self.x < margin_x:
             self.x = target_rect.centerx - margin_x
@@ -494,128 +1108,855 @@ class Camera:
         elif target_rect.centery - self.y > HEIGHT - margin_y:
             self.y = target_rect.centery - (HEIGHT - margin_y)
 
-        level_map = LEVEL_MAP_1 if current_level == 1 else LEVEL_MAP_2
-        world_w = max(len(row) for row in level_map) * TILE_SIZE
-        world_h = len(level_map) * TILE_SIZE
-        self.x = max(0, min(self.x, world_w - WIDTH))
-        self.y = max(0, min(self.y, world_h - HEIGHT))
-
-
-def build_level(level_num):
-    if level_num == 1:
-        level_map = LEVEL_MAP_1
-    elif level_num == 2:
-        level_map = LEVEL_MAP_2
-    elif level_num == 3:
-        level_map = LEVEL_MAP_3
-    else:
-        level_map = LEVEL_MAP_1  # fallback
-
-    solids, powerups, enemies, shooters, spikes, flags = [], [], [], [], [], []
-    player_start = START_POS
-    for y, row in enumerate(level_map):
-        for x, ch in enumerate(row):
-            if ch == '#':
-                solids.append(Platform(rect_from_grid(x, y)))
-            elif ch == 'L':
-                solids.append(Platform(rect_from_grid(x, y), True))
-            elif ch == 'P':
-                player_start = (x * TILE_SIZE, y * TILE_SIZE - (PLAYER_SIZE[1] - TILE_SIZE))
-            elif ch == 'J':
-                powerups.append(Powerup(rect_from_grid(x, y), type="double"))
-            elif ch == 'S':
-                powerups.append(Powerup(rect_from_grid(x, y), type="shrink"))
-            elif ch == 'H':
-                powerups.append(Powerup(rect_from_grid(x, y), type="health"))
-            elif ch == 'E':
-                enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
-                enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
-                enemies.append(Enemy((enemy_x, enemy_y)))
-            elif ch == 'F':
-                enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
-                enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
-                dir = 1 if x > len(row) / 2 else -1
-                shooters.append(ShootingEnemy((enemy_x, enemy_y), dir))
-            elif ch == '^':
-                spike_rect = rect_from_grid(x, y)
-                spike_rect.width = TILE_SIZE // 2
-                spike_rect.height = TILE_SIZE // 2
-                spike_rect.left = x * TILE_SIZE
-                spike_rect.bottom = (y + 1) * TILE_SIZE
-                spikes.append(Spike(spike_rect))
-            elif ch == 'G':
-                flags.append(Flag(rect_from_grid(x, y)))
-            elif ch == "C":
-                enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
-                enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
-                enemies.append(PatrolEnemy((enemy_x, enemy_y), patrol_distance=300, speed=120))
-
-    return solids, powerups, enemies, shooters, spikes, flags, player_start
+        self.x = max(0, min(self.x, level.world_w - WIDTH))
+        self.y = max(0, min(self.y, level.world_h - HEIGHT))
 
+    def visible_rect(self, margin=CULL_MARGIN):
+        # World-space area currently on screen, grown by margin on every side
+        return pygame.Rect(int(self.x) - margin, int(self.y) - margin, WIDTH + margin * 2, HEIGHT + margin * 2)
 
-# -------------- Main --------------
-def main():
-    global current_level
-
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption(TITLE)
-    clock = pygame.time.Clock()
-    font = pygame.font.SysFont("verdana", 16)
-
-    def reset_game():
-        solids, powerups, enemies, shooters, spikes, flags, start = build_level(current_level)
-        player = Player(start)
-        projectiles = []
-        camera = Camera()
-        spawn_protect = 0.15
-        return solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect
 
-    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
+class DrawStats:
+    # Per-frame count of entities drawn vs skipped by viewport culling
+    def __init__(self):
+        self.drawn = 0
+        self.culled = 0
+
+    def reset(self):
+        self.drawn = 0
+        self.culled = 0
+
+
+def queue_visible(batch, camera, entities, view, stats, sprite):
+    # Adds (surface, screen pos) for every entity overlapping the view to a
+    # Surface.blits batch. sprite is a baked Surface, or a function picking
+    # one per entity.
+    cam_x, cam_y = int(camera.x), int(camera.y)
+    pick = sprite if callable(sprite) else None
+    for ent in entities:
+        r = ent.rect
+        if view.colliderect(r):
+            batch.append((pick(ent) if pick else sprite, (r.x - cam_x, r.y - cam_y)))
+            stats.drawn += 1
+        else:
+            stats.culled += 1
 
-    running = True
-    while running:
-        dt = clock.tick(FPS) / 1000.0
-        if spawn_protect > 0:
-            spawn_protect -= dt
 
-        jump_pressed = False
-        shrink_pressed = False
-        input_dir = 0
+# -------------- Sprite cache --------------
+class SpriteCache:
+    # Every entity look baked once into its own surface by running the
+    # entity's draw() at the origin, so the draw methods stay the one place
+    # that defines how things look and a frame is a single Surface.blits.
+    def __init__(self):
+        origin = Camera()
+        tile = rect_from_grid(0, 0)
+
+        def bake(ent):
+            # One spare pixel: polygon shapes like the spikes touch rect.bottom
+            surf = pygame.Surface((ent.rect.width + 1, ent.rect.height + 1), pygame.SRCALPHA)
+            ent.draw(surf, origin)
+            return surf.convert_alpha() if pygame.display.get_surface() is not None else surf
+
+        self.spike = bake(Spike(pygame.Rect(0, 0, TILE_SIZE // 2, TILE_SIZE // 2)))
+        self.flag = bake(Flag(tile))
+        self.powerups = {kind: bake(Powerup(tile, kind)) for kind in ("double", "shrink", "health")}
+        self.enemy = bake(Enemy((0, 0)))
+        self.patrol_enemy = bake(PatrolEnemy((0, 0)))
+        self.shooter = bake(ShootingEnemy((0, 0), 1))
+
+        # Projectiles have no entity class, see ProjectileSystem
+        half = PROJECTILE_SIZE // 2
+        self.projectile = pygame.Surface((PROJECTILE_SIZE, PROJECTILE_SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(self.projectile, PROJECTILE_COLOR, (half, half), half)
+        if pygame.display.get_surface() is not None:
+            self.projectile = self.projectile.convert_alpha()
+
+        # (is_small, facing) -> surface
+        self.player = {}
+        for small in (False, True):
+            for facing in (1, -1):
+                player = Player((0, 0))
+                player.is_small = small
+                player.facing = facing
+                player.rect.size = PLAYER_SIZE_SMALL if small else PLAYER_SIZE
+                self.player[small, facing] = bake(player)
+
+    def powerup(self, powerup):
+        return self.powerups[powerup.type]
+
+    def player_sprite(self, player):
+        return self.player[player.is_small, player.facing]
+
+
+@functools.lru_cache(maxsize=None)
+def get_sprites():
+    # Baked on first draw, after the display exists so surfaces get converted
+    return SpriteCache()
+
+
+# -------------- Compiled levels --------------
+# A compiled level is one binary file:
+#   header | spawn table | padding to 16 bytes | uint8 tile grid (rows x cols)
+# Files live in LEVEL_CACHE_DIR named by a hash of the map text, so a map is
+# only parsed once and later loads just memory-map the grid.
+LEVEL_FORMAT_MAGIC = b"PLVL"
+LEVEL_FORMAT_VERSION = 1
+LEVEL_HEADER = struct.Struct("<4sHHIIIII")  # magic, version, tile, cols, rows, world w, world h, spawns
+LEVEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".level_cache")
+
+TILE_EMPTY = 0
+TILE_SOLID = 1
+TILE_LADDER = 2
+TILE_PLAYER = 3
+TILE_DOUBLE = 4
+TILE_SHRINK = 5
+TILE_HEALTH = 6
+TILE_ENEMY = 7
+TILE_SHOOTER = 8
+TILE_SPIKE = 9
+TILE_FLAG = 10
+TILE_PATROL = 11
+TILE_CODES = {
+    '#': TILE_SOLID, 'L': TILE_LADDER, 'P': TILE_PLAYER, 'J': TILE_DOUBLE,
+    'S': TILE_SHRINK, 'H': TILE_HEALTH, 'E': TILE_ENEMY, 'F': TILE_SHOOTER,
+    '^': TILE_SPIKE, 'G': TILE_FLAG, 'C': TILE_PATROL,
+}
+FIRST_SPAWN_CODE = TILE_PLAYER  # every code from here up is an entity spawn
+
+SPAWN_DTYPE = np.dtype([("code", "u1"), ("dir", "i1"), ("x", "<i4"), ("y", "<i4")])
+
+_TILE_LUT = np.zeros(256, dtype=np.uint8)
+for _ch, _code in TILE_CODES.items():
+    _TILE_LUT[ord(_ch)] = _code
+
+
+class CompiledLevel:
+    def __init__(self, grid, spawns, tile_size=TILE_SIZE):
+        self.grid = grid      # uint8 tile codes, rows x cols
+        self.spawns = spawns  # SPAWN_DTYPE records in row-major map order
+        self.tile_size = tile_size
+        self.rows, self.cols = grid.shape
+        self.world_w = self.cols * tile_size
+        self.world_h = self.rows * tile_size
+
+
+def level_cache_key(level_map):
+    h = hashlib.sha1(f"{LEVEL_FORMAT_VERSION}:{TILE_SIZE}\n".encode())
+    for row in level_map:
+        h.update(row.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def compile_level(level_map):
+    rows = len(level_map)
+    cols = max((len(row) for row in level_map), default=0)
+    grid = np.zeros((rows, cols), dtype=np.uint8)
+    row_len = np.zeros(rows, dtype=np.int32)
+    for y, row in enumerate(level_map):
+        # Non-ASCII characters become '?' so indices stay aligned with the map
+        chars = np.frombuffer(row.encode("ascii", "replace"), dtype=np.uint8)
+        grid[y, :len(chars)] = _TILE_LUT[chars]
+        row_len[y] = len(row)
+
+    ys, xs = np.nonzero(grid >= FIRST_SPAWN_CODE)
+    spawns = np.zeros(len(ys), dtype=SPAWN_DTYPE)
+    spawns["code"] = grid[ys, xs]
+    spawns["x"] = xs
+    spawns["y"] = ys
+    # Shooters on the right half of their row fire down-right, others down-left
+    spawns["dir"] = np.where(xs > row_len[ys] / 2, 1, -1)
+
+    header = LEVEL_HEADER.pack(LEVEL_FORMAT_MAGIC, LEVEL_FORMAT_VERSION, TILE_SIZE, cols, rows,
+                               cols * TILE_SIZE, rows * TILE_SIZE, len(spawns))
+    body = header + spawns.tobytes()
+    body += bytes(-len(body) % 16)
+    return body + grid.tobytes()
+
+
+def _grid_offset(n_spawns):
+    offset = LEVEL_HEADER.size + n_spawns * SPAWN_DTYPE.itemsize
+    return offset + (-offset % 16)
+
+
+def parse_level_header(data):
+    if len(data) < LEVEL_HEADER.size:
+        raise ValueError("truncated compiled level")
+    magic, version, tile_size, cols, rows, world_w, world_h, n_spawns = LEVEL_HEADER.unpack_from(data)
+    if magic != LEVEL_FORMAT_MAGIC or version != LEVEL_FORMAT_VERSION:
+        raise ValueError("not a compiled level or wrong format version")
+    return tile_size, cols, rows, n_spawns
+
+
+def load_compiled_level(path):
+    with open(path, "rb") as f:
+        tile_size, cols, rows, n_spawns = parse_level_header(f.read(LEVEL_HEADER.size))
+        if os.fstat(f.fileno()).st_size != _grid_offset(n_spawns) + rows * cols:
+            raise ValueError("truncated compiled level")
+        spawns = np.fromfile(f, dtype=SPAWN_DTYPE, count=n_spawns)
+    if rows * cols:
+        grid = np.memmap(path, dtype=np.uint8, mode="r", offset=_grid_offset(n_spawns), shape=(rows, cols))
+    else:
+        grid = np.zeros((rows, cols), dtype=np.uint8)
+    return CompiledLevel(grid, spawns, tile_size)
+
+
+def compiled_level_from_bytes(data):
+    tile_size, cols, rows, n_spawns = parse_level_header(data)
+    spawns = np.frombuffer(data, dtype=SPAWN_DTYPE, count=n_spawns, offset=LEVEL_HEADER.size)
+    grid = np.frombuffer(data, dtype=np.uint8, count=rows * cols, offset=_grid_offset(n_spawns))
+    return CompiledLevel(grid.reshape(rows, cols), spawns, tile_size)
+
+
+def get_compiled_level(level_map, cache_dir=LEVEL_CACHE_DIR):
+    # Load a level from the on-disk cache, compiling it on a miss
+    path = os.path.join(cache_dir, level_cache_key(level_map) + ".lvl")
+    try:
+        return load_compiled_level(path)
+    except (OSError, ValueError):
+        pass
+
+    data = compile_level(level_map)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return load_compiled_level(path)
+    except OSError:
+        # Read-only checkout or similar: keep the compiled level in memory
+        return compiled_level_from_bytes(data)
+
+
+# -------------- Level --------------
+class Level:
+    # Everything build_level produces for one map: precomputed world bounds,
+    # the tile grid, the collision grid and the entity spawn lists.
+    def __init__(self, num, compiled, solids, grid, powerups, enemies, shooters, spikes, flags, player_start):
+        self.num = num
+        self.tiles = compiled.grid
+        self.tile_size = compiled.tile_size
+        self.cols = compiled.cols
+        self.rows = compiled.rows
+        self.world_w = compiled.world_w
+        self.world_h = compiled.world_h
+        self.solids = solids
+        self.grid = grid
+        self.powerups = powerups
+        self.enemies = enemies
+        self.shooters = shooters
+        self.spikes = spikes
+        self.flags = flags
+        self.player_start = player_start
+        self.static_layer = None  # pre-baked terrain chunks, set by LevelPreloader
+
+
+def build_level(level_num, level_map=None, cache_dir=LEVEL_CACHE_DIR):
+    if level_map is None:
+        level_map = LEVEL_MAPS.get(level_num, LEVEL_MAP_1)  # fallback to level 1
+
+    compiled = get_compiled_level(level_map, cache_dir)
+    tiles = compiled.grid
 
-        for e in pygame.event.get():
-            if e.type == pygame.QUIT:
-                running = False
-            elif e.type == pygame.KEYDOWN:
-                if e.key in (pygame.K_ESCAPE, pygame.K_q):
-                    running = False
-                if e.key == pygame.K_r:
-                    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-                if e.key == pygame.K_1:
-                    current_level = 1
-                    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-                if e.key == pygame.K_2:
-                    current_level = 2
-                    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-                if e.key == pygame.K_s or e.key == pygame.K_DOWN:
-                    shrink_pressed = True
+    solids, powerups, enemies, shooters, spikes, flags = [], [], [], [], [], []
+    grid = CollisionGrid()
 
-        # Continuous input
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-            input_dir -= 1
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-            input_dir += 1
-        if keys[pygame.K_SPACE] or keys[pygame.K_w] or keys[pygame.K_UP]:
-            jump_pressed = True
-        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-            shrink_pressed = True
+    # Solid terrain is merged into as few rects as possible; ladders stay per tile
+    for x, y, w, h in merge_solid_tiles(tiles == TILE_SOLID):
+        solids.append(Platform(rect_from_grid(x, y, w, h)))
+        grid.add(solids[-1])
+    for y, x in np.argwhere(tiles == TILE_LADDER).tolist():
+        solids.append(Platform(rect_from_grid(x, y), True))
+        grid.add(solids[-1])
 
-        player.update(dt, solids, input_dir, jump_pressed, shrink_pressed)
+    player_start = START_POS
+    for code, direction, x, y in compiled.spawns.tolist():
+        if code == TILE_PLAYER:
+            player_start = (x * TILE_SIZE, y * TILE_SIZE - (PLAYER_SIZE[1] - TILE_SIZE))
+        elif code == TILE_DOUBLE:
+            powerups.append(Powerup(rect_from_grid(x, y), type="double"))
+        elif code == TILE_SHRINK:
+            powerups.append(Powerup(rect_from_grid(x, y), type="shrink"))
+        elif code == TILE_HEALTH:
+            powerups.append(Powerup(rect_from_grid(x, y), type="health"))
+        elif code == TILE_ENEMY:
+            enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
+            enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
+            enemies.append(Enemy((enemy_x, enemy_y)))
+        elif code == TILE_SHOOTER:
+            enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
+            enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
+            shooters.append(ShootingEnemy((enemy_x, enemy_y), direction))
+        elif code == TILE_SPIKE:
+            spike_rect = rect_from_grid(x, y)
+            spike_rect.width = TILE_SIZE // 2
+            spike_rect.height = TILE_SIZE // 2
+            spike_rect.left = x * TILE_SIZE
+            spike_rect.bottom = (y + 1) * TILE_SIZE
+            spikes.append(Spike(spike_rect))
+        elif code == TILE_FLAG:
+            flags.append(Flag(rect_from_grid(x, y)))
+        elif code == TILE_PATROL:
+            enemy_x = x * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[0]) // 2
+            enemy_y = y * TILE_SIZE + (TILE_SIZE - ENEMY_SIZE[1]) // 2
+            enemies.append(PatrolEnemy((enemy_x, enemy_y), patrol_distance=300, speed=120))
+
+    return Level(level_num, compiled, solids, grid, powerups, enemies, shooters, spikes, flags, player_start)
+
+
+# -------------- Text cache --------------
+@functools.lru_cache(maxsize=None)
+def get_font(name, size):
+    # SysFont scans the system font list, so only resolve each font once
+    return pygame.font.SysFont(name, size)
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, color), least recently
+    # used entries are evicted once max_entries is reached
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            return surf
+
+        surf = font.render(text, True, color)
+        self.entries[key] = surf
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surf
+
+
+# -------------- Profiler --------------
+PROFILE_PHASES = (
+    "events", "player", "enemies", "shooters", "projectiles", "broadphase", "contacts", "camera", "flags",
+    "draw_background", "draw_terrain", "draw_powerups", "draw_enemies", "draw_shooters",
+    "draw_projectiles", "draw_spikes", "draw_flags", "draw_player", "draw_sprites", "draw_hud", "flip",
+)
+
+
+class NullProfiler:
+    # Stand-in used when profiling is off, so call sites don't need checks
+    def begin_frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class FrameProfiler:
+    # Per-phase frame timings in a fixed-size ring buffer. Call begin_frame(),
+    # then mark(phase) at the end of each phase; the time since the previous
+    # mark is charged to that phase.
+    def __init__(self, phases=PROFILE_PHASES, capacity=600):
+        self.phases = list(phases)
+        self.index = {name: i for i, name in enumerate(self.phases)}
+        self.samples = np.zeros((capacity, len(self.phases)))
+        self.current = np.zeros(len(self.phases))
+        self.frames = 0  # total frames recorded, the buffer keeps the last `capacity`
+        self.last = time.perf_counter()
+
+    def begin_frame(self):
+        self.current[:] = 0
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        self.samples[self.frames % len(self.samples)] = self.current
+        self.frames += 1
+
+    def recorded(self):
+        # Recorded frames oldest first, in seconds
+        n = len(self.samples)
+        if self.frames <= n:
+            return self.samples[:self.frames]
+        start = self.frames % n
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+    def percentiles(self, q=(50, 95, 99)):
+        # Milliseconds per phase, one row per requested percentile, plus the
+        # frame total as the last column
+        data = self.recorded()
+        if not len(data):
+            return np.zeros((len(q), len(self.phases) + 1))
+        data = np.column_stack((data, data.sum(axis=1)))
+        return np.percentile(data, q, axis=0) * 1000.0
+
+    def export_csv(self, path):
+        data = self.recorded() * 1000.0
+        first = self.frames - len(data)
+        with open(path, "w") as f:
+            f.write("frame," + ",".join(f"{p}_ms" for p in self.phases) + ",total_ms\n")
+            for i, row in enumerate(data):
+                f.write(f"{first + i}," + ",".join(f"{v:.4f}" for v in row) + f",{row.sum():.4f}\n")
+
+
+class ProfilerOverlay:
+    # p50/p95/p99 table drawn over the game, refreshed a few times a second
+    def __init__(self, profiler, refresh_frames=30):
+        self.profiler = profiler
+        self.refresh_frames = refresh_frames
+        self.visible = False
+        self.lines = []
+        self.background = None
+        self.next_refresh = 0
+
+    def draw(self, surf, font, text_cache):
+        if self.profiler.frames >= self.next_refresh:
+            self.next_refresh = self.profiler.frames + self.refresh_frames
+            p50, p95, p99 = self.profiler.percentiles()
+            names = self.profiler.phases + ["total"]
+            self.lines = [f"{'phase':<17}{'p50':>7}{'p95':>7}{'p99':>7}"]
+            self.lines += [f"{name:<17}{a:7.2f}{b:7.2f}{c:7.2f}" for name, a, b, c in zip(names, p50, p95, p99)]
+
+        x = WIDTH - 300
+        if self.background is None:
+            self.background = pygame.Surface((300, len(self.lines) * 16 + 8))
+            self.background.set_alpha(180)
+        area = surf.blit(self.background, (x - 8, 4))
+        for i, line in enumerate(self.lines):
+            surf.blit(text_cache.render(font, line, (200, 230, 200)), (x, 8 + i * 16))
+        return area
+
+
+# -------------- Level preloading --------------
+def next_level_num(level_num):
+    # Level that follows level_num once its flag is reached, None after the last
+    return level_num + 1 if level_num in LEVEL_MAPS and level_num + 1 in LEVEL_MAPS else None
+
+
+class LevelPreloader:
+    # Builds a level (and optionally bakes its terrain chunks) on a worker
+    # thread while the current level is played, so switching to it is just
+    # a swap.
+    def __init__(self, bake_chunks=True, cache_dir=LEVEL_CACHE_DIR):
+        self.bake_chunks = bake_chunks
+        self.cache_dir = cache_dir
+        self.pending = None  # {"num", "thread", "level", "error"} for the latest request
+
+    def request(self, level_num):
+        if self.pending is not None and self.pending["num"] == level_num:
+            return
+        # Each request gets its own slot so a stale build can't leak into a newer one
+        job = {"num": level_num, "level": None, "error": None}
+        job["thread"] = threading.Thread(target=self._build, args=(job,), daemon=True)
+        self.pending = job
+        job["thread"].start()
+
+    def _build(self, job):
+        try:
+            level = build_level(job["num"], cache_dir=self.cache_dir)
+            if self.bake_chunks:
+                level.static_layer = StaticLayer(level.tiles, convert=False)
+            job["level"] = level
+        except Exception as e:  # reported from take() on the main thread
+            job["error"] = e
+
+    def take(self, level_num):
+        # The prepared level, waiting for the worker if it is still running,
+        # or None if level_num was never requested
+        job = self.pending
+        if job is None or job["num"] != level_num:
+            return None
+        self.pending = None
+        job["thread"].join()
+        if job["error"] is not None:
+            raise job["error"]
+        return job["level"]
+
+
+# -------------- Activity regions --------------
+def rows_touching(pos, size, rect):
+    # Bool mask of the (n, 2) top-left positions whose boxes of `size` overlap rect
+    return ((pos[:, 0] < rect.right) & (pos[:, 0] + size[0] > rect.left) &
+            (pos[:, 1] < rect.bottom) & (pos[:, 1] + size[1] > rect.top))
+
+
+def activity_views(camera):
+    # The active and near band rects, built once a step for every kind
+    return camera.visible_rect(ACTIVE_MARGIN), camera.visible_rect(NEAR_MARGIN)
+
+
+class ActivityRegions:
+    # Simulation level of detail around the camera for one kind of entity.
+    # Rows overlapping the view grown by ACTIVE_MARGIN tick every step, rows
+    # out to NEAR_MARGIN tick every NEAR_TICK_INTERVAL steps (staggered by
+    # row so the cost is spread out), and everything further away sleeps.
+    # last_tick/last_time say when each row last ran, so a row that wakes
+    # up knows exactly how many steps and seconds it missed. Kinds with
+    # fewer than LOD_MIN_ROWS rows aren't enabled and World.step just runs
+    # every row every step.
+    def __init__(self, count):
+        self.last_tick = np.zeros(count, dtype=np.int64)
+        self.last_time = np.zeros(count)
+        # Rows whose near band tick falls on each step of the interval
+        self.stagger = [np.arange(k, count, NEAR_TICK_INTERVAL) for k in range(NEAR_TICK_INTERVAL)]
+        self.enabled = count >= LOD_MIN_ROWS
+
+    def due(self, pos, size, views, tick):
+        # Rows to run this step, in row order. Only this step's stagger rows
+        # are tested against the near band.
+        active_view, near_view = views
+        due = rows_touching(pos, size, active_view)
+        turn = self.stagger[tick % NEAR_TICK_INTERVAL]
+        due[turn] |= rows_touching(pos[turn], size, near_view)
+        return np.flatnonzero(due)
+
+    def run(self, rows, tick, now):
+        # Record that rows run now, returns (steps missed + 1, seconds since
+        # they last ran) per row
+        gap = tick - self.last_tick[rows]
+        elapsed = now - self.last_time[rows]
+        self.last_tick[rows] = tick
+        self.last_time[rows] = now
+        return gap, elapsed
+
+
+# -------------- Snapshots --------------
+SNAPSHOT_MAGIC = b"PSNP"
+SNAPSHOT_VERSION = 1
+# magic, version, level, custom map, won, tick, time, spawn protect, camera
+# x, y, then counts: enemies, shooters, powerups, projectile slots, free slots
+SNAPSHOT_HEADER = struct.Struct("<4sHH??qddddIIIII")
+# rect x, y, w, h, vel x, y, on_ground, facing, can_double_jump,
+# has_double_jump, can_shrink, jump_was_pressed, is_colliding_ladder,
+# is_small, shrink_timer, last_y, health, invuln_timer
+PLAYER_STATE = struct.Struct("<4i2d?b??????diid")
+REWIND_SECONDS = 5.0  # buffer length for --rewind; rewinding is off unless asked for
+REWIND_KEYFRAME_EVERY = SIM_RATE
+
+
+class SnapshotReader:
+    # Walks the array sections of a snapshot blob in order
+    def __init__(self, blob, offset):
+        self.blob = blob
+        self.offset = offset
+
+    def take(self, dtype, count):
+        arr = np.frombuffer(self.blob, dtype=dtype, count=count, offset=self.offset)
+        self.offset += arr.nbytes
+        return arr
+
+
+class RewindBuffer:
+    # The last `seconds` of World snapshots at `rate` per second in bounded
+    # memory. Every keyframe_every-th snapshot is stored whole, the others
+    # as their XOR against that keyframe, which is mostly zeros; all of it
+    # zlib compressed. A keyframe stays alive while any of its deltas does.
+    def __init__(self, seconds=REWIND_SECONDS, rate=SIM_RATE, keyframe_every=REWIND_KEYFRAME_EVERY):
+        self.frames = deque(maxlen=max(1, int(seconds * rate)))  # (keyframe, delta or None)
+        self.keyframe_every = keyframe_every
+        self.key = None  # (raw, compressed) of the keyframe new deltas use
+        self.since_key = 0
+        self.cached = (None, None)  # last decompressed keyframe
+
+    def __len__(self):
+        return len(self.frames)
+
+    def nbytes(self):
+        keys = {id(key): len(key) for key, _ in self.frames}
+        return sum(keys.values()) + sum(len(delta) for _, delta in self.frames if delta is not None)
+
+    def push(self, blob):
+        key = self.key
+        if key is None or self.since_key >= self.keyframe_every or len(key[0]) != len(blob):
+            self.key = (blob, zlib.compress(blob))
+            self.since_key = 1
+            self.frames.append((self.key[1], None))
+            return
+        delta = np.bitwise_xor(np.frombuffer(blob, dtype=np.uint8), np.frombuffer(key[0], dtype=np.uint8))
+        self.frames.append((key[1], zlib.compress(delta.tobytes())))
+        self.since_key += 1
+
+    def pop(self):
+        # Newest snapshot, removed from the buffer, or None when empty
+        if not self.frames:
+            return None
+        key, delta = self.frames.pop()
+        if self.key is not None and self.key[1] is key:
+            self.since_key -= 1
+            if self.since_key <= 0:
+                self.key = None
+        if self.cached[0] is not key:
+            self.cached = (key, zlib.decompress(key))
+        raw = self.cached[1]
+        if delta is None:
+            return raw
+        return np.bitwise_xor(np.frombuffer(zlib.decompress(delta), dtype=np.uint8),
+                              np.frombuffer(raw, dtype=np.uint8)).tobytes()
+
+    def clear(self):
+        self.frames.clear()
+        self.key = None
+        self.since_key = 0
+
+
+# -------------- World --------------
+class World:
+    # All mutable game state plus one simulation step, with no rendering or
+    # input polling, so it can run inside main() or headless.
+    def __init__(self, level_num=1, level_map=None, cache_dir=LEVEL_CACHE_DIR):
+        self.level_num = level_num
+        self.level_map = level_map  # custom map instead of LEVEL_MAPS[level_num]
+        self.cache_dir = cache_dir
+        self.won = False
+        self.profiler = NullProfiler()
+        self.preloader = None  # optional LevelPreloader for the next level
+        self.generation = 0  # bumped on every reset or restore so renderers can rebuild
+        self.projectiles = ProjectileSystem()  # one pool for the whole session
+        # (level_num, custom map?) -> (level_map, Level, pristine snapshot)
+        # so restarts and revisits restore a snapshot instead of rebuilding
+        self.levels = {}
+        self.reset()
+
+    def enable_preloading(self, preloader):
+        self.preloader = preloader
+        self.preload_next()
+
+    def preload_next(self):
+        nxt = next_level_num(self.level_num) if self.level_map is None else None
+        if self.preloader is not None and nxt is not None and (nxt, False) not in self.levels:
+            self.preloader.request(nxt)
+
+    def level_key(self):
+        return self.level_num, self.level_map is not None
+
+    def reset(self, level=None):
+        # Restart the current level from its pristine snapshot if it has
+        # been set up before, otherwise build it (or use `level`)
+        key = self.level_key()
+        if level is None and key in self.levels:
+            self.restore(self.levels[key][2])
+            return
+        if level is None:
+            level = build_level(self.level_num, self.level_map, self.cache_dir)
+        self.attach(level)
+        self.levels[key] = (self.level_map, level, self.snapshot())
+
+    def attach(self, level):
+        # Fresh state for `level`: everything derived from it plus the
+        # mutable state at the start of the level
+        self.level = level
+        self.solids = level.solids
+        self.powerups = list(level.powerups)
+        self.enemies = EnemyBatch(level.enemies)
+        self.shooters = level.shooters
+        self.spikes = level.spikes
+        self.flags = level.flags
+        self.player = Player(level.player_start)
+        self.projectiles.clear()
+        self.tick = 0
+        self.time = 0.0
+        self.enemy_regions = ActivityRegions(self.enemies.count)
+        self.shooter_pos = np.array([s.rect.topleft for s in self.shooters], dtype=float).reshape(-1, 2)
+        self.shooter_regions = ActivityRegions(len(self.shooters))
+        self.broadphase = Broadphase()
+        self.broadphase.add_objects(LAYER_POWERUP, level.powerups)
+        self.broadphase.add_objects(LAYER_SHOOTER, level.shooters)
+        self.broadphase.add_objects(LAYER_SPIKE, level.spikes)
+        self.broadphase.add_objects(LAYER_FLAG, level.flags)
+        self.broadphase.sync_array(LAYER_ENEMY, self.enemies.pos, ENEMY_SIZE)
+        self.broadphase.sync_array(LAYER_PROJECTILE, self.projectiles.pos, (PROJECTILE_SIZE, PROJECTILE_SIZE),
+                                   self.projectiles.alive)
+        self.camera = Camera()
+        self.spawn_protect = 0.15
+        self.generation += 1
+
+    def load_level(self, level_num):
+        self.level_num = level_num
+        self.level_map = None
+        level = None
+        if self.preloader is not None and self.level_key() not in self.levels:
+            level = self.preloader.take(level_num)
+        self.reset(level)
+        self.preload_next()
+
+    def snapshot(self):
+        # Every piece of mutable world state as one binary blob. Enemy and
+        # projectile sections are fixed size per level, so consecutive
+        # snapshots line up byte for byte (see RewindBuffer).
+        player = self.player
+        enemies = self.enemies
+        projectiles = self.projectiles
+        remaining = {id(p) for p in self.powerups}
+        parts = [
+            SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.level_num, self.level_map is not None, self.won,
+                self.tick, self.time, self.spawn_protect, self.camera.x, self.camera.y,
+                enemies.count, len(self.shooters), len(self.level.powerups), projectiles.capacity,
+                len(projectiles.free)),
+            PLAYER_STATE.pack(
+                *player.rect, player.vel.x, player.vel.y, player.on_ground, player.facing,
+                player.can_double_jump, player.has_double_jump, player.can_shrink, player.jump_was_pressed,
+                player.is_colliding_ladder, player.is_small, player.shrink_timer, player.last_y,
+                player.health, player.invuln_timer),
+            enemies.pos.tobytes(), enemies.direction.tobytes(),
+            self.enemy_regions.last_tick.tobytes(), self.enemy_regions.last_time.tobytes(),
+            np.array([s.shoot_timer for s in self.shooters], dtype=float).tobytes(),
+            self.shooter_regions.last_tick.tobytes(), self.shooter_regions.last_time.tobytes(),
+            np.packbits(np.array([id(p) in remaining for p in self.level.powerups], dtype=bool)).tobytes(),
+            projectiles.pos.tobytes(), projectiles.vel.tobytes(), projectiles.direction.tobytes(),
+            projectiles.age.tobytes(), projectiles.alive.tobytes(),
+            np.array(projectiles.free, dtype=np.int32).tobytes(),
+        ]
+        return b"".join(parts)
+
+    def restore(self, blob):
+        # Put the world back to a snapshot(). Levels are looked up in
+        # self.levels, so the snapshot's level must have been visited.
+        (magic, version, level_num, custom, won, tick, now, spawn_protect, cam_x, cam_y,
+         n_enemies, n_shooters, n_powerups, capacity, n_free) = SNAPSHOT_HEADER.unpack_from(blob)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not a world snapshot, or an unsupported version")
+        if (level_num, custom) not in self.levels:
+            raise ValueError(f"snapshot is for level {level_num}, which this world hasn't loaded")
+        level_map, level, _ = self.levels[level_num, custom]
+        self.level_num = level_num
+        self.level_map = level_map
+        if level is not self.level:
+            self.attach(level)
+        if capacity != self.projectiles.capacity:
+            raise ValueError("snapshot has a different projectile pool size")
+
+        self.won = won
+        self.tick = tick
+        self.time = now
+        self.spawn_protect = spawn_protect
+        self.camera.x = cam_x
+        self.camera.y = cam_y
+
+        fields = PLAYER_STATE.unpack_from(blob, SNAPSHOT_HEADER.size)
+        player = self.player
+        player.rect = pygame.Rect(fields[:4])
+        player.vel = pygame.Vector2(fields[4], fields[5])
+        (player.on_ground, player.facing, player.can_double_jump, player.has_double_jump, player.can_shrink,
+         player.jump_was_pressed, player.is_colliding_ladder, player.is_small, player.shrink_timer,
+         player.last_y, player.health, player.invuln_timer) = fields[6:]
+
+        read = SnapshotReader(blob, SNAPSHOT_HEADER.size + PLAYER_STATE.size)
+        enemies = self.enemies
+        enemies.pos[:] = read.take(float, n_enemies * 2).reshape(-1, 2)
+        enemies.direction[:] = read.take(float, n_enemies)
+        self.enemy_regions.last_tick[:] = read.take(np.int64, n_enemies)
+        self.enemy_regions.last_time[:] = read.take(float, n_enemies)
+        for s, timer in zip(self.shooters, read.take(float, n_shooters).tolist()):
+            s.shoot_timer = timer
+        self.shooter_regions.last_tick[:] = read.take(np.int64, n_shooters)
+        self.shooter_regions.last_time[:] = read.take(float, n_shooters)
+        keep = np.unpackbits(read.take(np.uint8, (n_powerups + 7) // 8), count=n_powerups).astype(bool)
+
+        projectiles = self.projectiles
+        projectiles.pos[:] = read.take(float, capacity * 2).reshape(-1, 2)
+        projectiles.vel[:] = read.take(float, capacity * 2).reshape(-1, 2)
+        projectiles.direction[:] = read.take(np.int8, capacity)
+        projectiles.age[:] = read.take(float, capacity)
+        projectiles.alive[:] = read.take(bool, capacity)
+        projectiles.free = read.take(np.int32, n_free).tolist()
+        projectiles.count = capacity - n_free
+
+        # Bring the broadphase in line: picked up powerups out, the rest in
+        bp = self.broadphase
+        present = {id(p) for p in self.powerups}
+        for handle, (p, wanted) in enumerate(zip(level.powerups, keep.tolist())):
+            if wanted and id(p) not in present:
+                bp.insert_object(LAYER_POWERUP, handle)
+            elif not wanted and id(p) in present:
+                bp.remove_object(LAYER_POWERUP, handle)
+        self.powerups = [p for p, wanted in zip(level.powerups, keep.tolist()) if wanted]
+        bp.sync_array(LAYER_ENEMY, enemies.pos, ENEMY_SIZE)
+        bp.sync_array(LAYER_PROJECTILE, projectiles.pos, (PROJECTILE_SIZE, PROJECTILE_SIZE), projectiles.alive)
+        self.generation += 1
+
+    def step(self, dt, input_dir, jump_pressed, shrink_pressed, up=False, down=False):
+        # vector_env.VectorEnv.step applies these same rules to many worlds
+        # at once; gameplay changes here need making there too
+        player = self.player
+        prof = self.profiler
+        if self.spawn_protect > 0:
+            self.spawn_protect -= dt
+
+        player_from = player.rect.topleft
+        player.update(dt, self.level, input_dir, jump_pressed, shrink_pressed, up, down)
+        prof.mark("player")
+
+        # Move everything first, then a single broadphase query finds what
+        # the player touches
+        # Only entities in the activity regions around the camera run; ones
+        # that missed steps catch up in closed form (see ActivityRegions)
+        self.tick += 1
+        self.time += dt
+        tick, now = self.tick, self.time
+        bp = self.broadphase
+        terrain = self.level.tiles if PROJECTILES_HIT_TERRAIN else None
+        enemies = self.enemies
+        views = None
+        if enemies.count and not self.enemy_regions.enabled:
+            enemies.update(dt)
+            bp.sync_array(LAYER_ENEMY, enemies.pos, ENEMY_SIZE)
+        elif enemies.count:
+            views = activity_views(self.camera)
+            rows = self.enemy_regions.due(enemies.pos, ENEMY_SIZE, views, tick)
+            if len(rows):
+                gap, _ = self.enemy_regions.run(rows, tick, now)
+                steady = gap == 1
+                enemies.update(dt, rows[steady])
+                enemies.advance(rows[~steady], gap[~steady], dt)
+                bp.sync_array(LAYER_ENEMY, enemies.pos, ENEMY_SIZE, rows=rows)
+        prof.mark("enemies")
+
+        if self.shooters and not self.shooter_regions.enabled:
+            for s in self.shooters:
+                s.update(dt, self.projectiles)
+        elif self.shooters:
+            if views is None:
+                views = activity_views(self.camera)
+            rows = self.shooter_regions.due(self.shooter_pos, ENEMY_SIZE, views, tick)
+            if len(rows):
+                gap, _ = self.shooter_regions.run(rows, tick, now)
+                for i, missed in zip(rows.tolist(), gap.tolist()):
+                    s = self.shooters[i]
+                    if missed > 1:
+                        s.catch_up(missed - 1, dt, self.projectiles, terrain)
+                    s.update(dt, self.projectiles)
+        prof.mark("shooters")
+
+        projectiles = self.projectiles
+        live = projectiles.count
+        if live:
+            # Only live slots move, so only they need new broadphase spans
+            moving = np.flatnonzero(projectiles.alive)
+            projectiles.update(dt)
+            bp.sync_array(LAYER_PROJECTILE, projectiles.pos, (PROJECTILE_SIZE, PROJECTILE_SIZE), projectiles.alive,
+                          moving)
+        prof.mark("projectiles")
+
+        # Projectile hits are swept, so reach back as far as one step of
+        # relative travel
+        moved = (player.rect.x - player_from[0], player.rect.y - player_from[1])
+        reach = 0
+        if live:
+            speed = np.abs(projectiles.vel[moving]).max()
+            reach = int(speed * dt) + max(abs(moved[0]), abs(moved[1])) + 1
+        touching = bp.query(player.rect.inflate(reach * 2, reach * 2))
+        prof.mark("broadphase")
 
         # Powerup pickup
-        if spawn_protect <= 0:
-            for p in powerups[:]:
+        if self.spawn_protect <= 0:
+            for handle in touching.get(LAYER_POWERUP, ()):
+                p = bp.objects[LAYER_POWERUP][handle]
                 if player.rect.colliderect(p.rect):
                     if p.type == "double":
                         player.can_double_jump = True
@@ -623,107 +1964,470 @@ def main():
                         player.can_shrink = True
                     elif p.type == "health":
                         player.health = min(player.max_health, player.health + 30)  # heal 30 HP
-                    powerups.remove(p)
+                    self.powerups.remove(p)
+                    bp.remove_object(LAYER_POWERUP, handle)
 
         # Enemies (normal + chasing)
-        for e in enemies:
-            if isinstance(e, PatrolEnemy):
-                e.update(dt)
-            if player.rect.colliderect(e.rect):
-                knock_dir = 1 if player.rect.centerx < e.rect.centerx else -1
+        rows = touching.get(LAYER_ENEMY)
+        if rows:
+            hit = enemies.contact(player.rect, rows)
+            if hit is not None:
+                knock_dir = hit[1]
                 player.take_damage(20, (-knock_dir * 300, -400))
 
-        # Shooting enemies + projectiles
-        for s in shooters:
-            s.update(dt, projectiles)
+        for handle in touching.get(LAYER_SHOOTER, ()):
+            s = self.shooters[handle]
             if player.rect.colliderect(s.rect):
                 knock_dir = 1 if player.rect.centerx < s.rect.centerx else -1
                 player.take_damage(10, (-knock_dir * 300, -400))
 
-        for spike in spikes:
-            if player.rect.colliderect(spike.rect):
+        for handle in touching.get(LAYER_SPIKE, ()):
+            if player.rect.colliderect(self.spikes[handle].rect):
                 player.take_damage(20, (0, -400))
 
-        for proj in projectiles[:]:
-            proj.update(dt)
-            if proj.rect.colliderect(player.rect):
-                player.take_damage(10, (300 if proj.direction < 0 else -300, -400))
-                projectiles.remove(proj)
-            elif proj.rect.y > HEIGHT + camera.y:
-                projectiles.remove(proj)
-
-        camera.update(player.rect)
+        if live:
+            hits = np.zeros(projectiles.capacity, dtype=bool)
+            rows = touching.get(LAYER_PROJECTILE)
+            if rows:
+                hits[rows] = projectiles.swept_overlaps(player.rect, dt, moved, rows)
+            if hits.any():
+                # Only the first hit can land, the rest hit during
+                # invulnerability. First means the oldest shot.
+                first = int(np.where(hits, projectiles.age, -1).argmax())
+                player.take_damage(10, (300 if projectiles.direction[first] < 0 else -300, -400))
+            level = self.level
+            freed = projectiles.remove(hits | projectiles.expired(level.world_w, level.world_h, terrain, dt))
+            if len(freed):
+                bp.sync_array(LAYER_PROJECTILE, projectiles.pos, (PROJECTILE_SIZE, PROJECTILE_SIZE),
+                              projectiles.alive, freed)
+        prof.mark("contacts")
+
+        self.camera.update(player.rect, self.level)
+        prof.mark("camera")
 
         # --- Flag detection (level complete) ---
-        for f in flags:
-            if player.rect.colliderect(f.rect):
+        for handle in touching.get(LAYER_FLAG, ()):
+            if player.rect.colliderect(self.flags[handle].rect):
                 # Move to next level
-                if current_level == 1:
-                    current_level = 2
-                    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-
-                elif current_level == 2:
-                    current_level = 3
-                    solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-
-
-                elif current_level == 3:
-
-                    print("🎉 You win! Congratulations! 🎉")
-                    # Display a "You Win" message on screen before quitting
-                    font = pygame.font.SysFont("verdana", 40)
-                    win_text = font.render("YOU WIN! CONGRATULATIONS!", True, (255, 255, 0))
-                    screen.fill((0, 0, 0))
-                    text_rect = win_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-                    screen.blit(win_text, text_rect)
-                    pygame.display.flip()
-                    pygame.time.delay(4000)  # wait 4 seconds
-                    running = False  # exit the main loop
+                nxt = next_level_num(self.level_num)
+                if nxt is not None:
+                    self.load_level(nxt)
+                else:
+                    self.won = True
+                prof.mark("flags")
+                return
 
         # Check for death
         if player.health <= 0:
-            solids, powerups, enemies, shooters, spikes, flags, player, projectiles, camera, spawn_protect = reset_game()
-            player.can_double_jump = False
-            player.can_shrink = False
-
-        # ---------- Draw ----------
-        screen.fill(BG_COLOR)
-
-        # Parallax background
+            self.reset()
+        prof.mark("flags")
+
+
+# -------------- Headless --------------
+HEADLESS_DT = 1.0 / SIM_RATE
+
+
+def default_input_script(step):
+    # Run right, hop every half second and try a shrink every 10 seconds
+    jump = step % 30 < 8
+    shrink = step % 600 == 0
+    return 1, jump, shrink, False, False
+
+
+def load_input_script(path):
+    # Text script, one segment per line: "<steps> <input_dir> [jump] [shrink] [up] [down]"
+    # with 0/1 flags. Blank lines and lines starting with # are ignored. The
+    # script loops once it runs out.
+    segments = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = [int(v) for v in line.split()]
+            parts += [0] * (6 - len(parts))
+            count, input_dir, jump, shrink, up, down = parts[:6]
+            segments.append((count, (input_dir, bool(jump), bool(shrink), bool(up), bool(down))))
+    if not segments:
+        raise ValueError(f"input script {path!r} is empty")
+
+    timeline = []
+    for count, controls in segments:
+        timeline.extend([controls] * count)
+
+    def script(step):
+        return timeline[step % len(timeline)]
+    return script
+
+
+def run_headless(level_num=1, steps=60 * SIM_RATE, dt=HEADLESS_DT, script=default_input_script):
+    # Step the simulation as fast as possible with a fixed dt and no display
+    world = World(level_num)
+    wins = 0
+    start = time.perf_counter()
+    for i in range(steps):
+        world.step(dt, *script(i))
+        if world.won:
+            wins += 1
+            world.won = False
+            world.load_level(level_num)
+    elapsed = time.perf_counter() - start
+    return {
+        "steps": steps,
+        "sim_seconds": steps * dt,
+        "wall_seconds": elapsed,
+        "steps_per_second": steps / elapsed if elapsed > 0 else float("inf"),
+        "wins": wins,
+        "level": world.level_num,
+        "peak_projectiles": world.projectiles.peak,
+        "dropped_projectiles": world.projectiles.dropped,
+    }
+
+
+# -------------- Input recording --------------
+# Each tick packs into one byte:
+#   bits 0-1 input_dir + 1, bit 2 jump, bit 3 shrink, bit 4 up, bit 5 down,
+#   bits 6-7 command (reset / switch level) issued before the step
+# and ticks are stored run-length encoded as (varint count, byte) pairs
+# after a small header, so idle or held input costs almost nothing.
+RECORDING_MAGIC = b"PREC"
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct("<4sHHdI")  # magic, version, level, dt, ticks
+
+CMD_NONE = 0
+CMD_RESET = 1
+CMD_LEVEL_1 = 2
+CMD_LEVEL_2 = 3
+
+
+def pack_controls(input_dir, jump, shrink, up, down, command=CMD_NONE):
+    return ((input_dir + 1) | jump << 2 | shrink << 3 | up << 4 | down << 5 | command << 6)
+
+
+def unpack_controls(packed):
+    controls = ((packed & 3) - 1, bool(packed & 4), bool(packed & 8), bool(packed & 16), bool(packed & 32))
+    return controls, packed >> 6
+
+
+def apply_command(world, command):
+    if command == CMD_RESET:
+        world.reset()
+    elif command == CMD_LEVEL_1:
+        world.load_level(1)
+    elif command == CMD_LEVEL_2:
+        world.load_level(2)
+
+
+class InputRecording:
+    def __init__(self, level_num=1, dt=HEADLESS_DT):
+        self.level_num = level_num
+        self.dt = dt
+        self.runs = []  # [packed, count]
+        self.ticks = 0
+
+    def append(self, packed):
+        if self.runs and self.runs[-1][0] == packed:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([packed, 1])
+        self.ticks += 1
+
+    def __iter__(self):
+        for packed, count in self.runs:
+            for _ in range(count):
+                yield packed
+
+    def to_bytes(self):
+        out = bytearray(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.level_num, self.dt, self.ticks))
+        for packed, count in self.runs:
+            while count >= 0x80:
+                out.append((count & 0x7F) | 0x80)
+                count >>= 7
+            out.append(count)
+            out.append(packed)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < RECORDING_HEADER.size:
+            raise ValueError("truncated input recording")
+        magic, version, level_num, dt, ticks = RECORDING_HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError("not an input recording or wrong format version")
+        rec = cls(level_num, dt)
+        i = RECORDING_HEADER.size
+        end = len(data)
+        while i < end:
+            count = shift = 0
+            while True:
+                if i >= end:
+                    raise ValueError("truncated input recording")
+                b = data[i]
+                i += 1
+                count |= (b & 0x7F) << shift
+                shift += 7
+                if not b & 0x80:
+                    break
+            if i >= end:
+                raise ValueError("truncated input recording")
+            rec.runs.append([data[i], count])
+            i += 1
+            rec.ticks += count
+        if rec.ticks != ticks:
+            raise ValueError("truncated input recording")
+        return rec
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def run_replay(recording):
+    # Feed a recording back at its fixed dt as fast as the CPU allows
+    world = World(recording.level_num)
+    steps = 0
+    start = time.perf_counter()
+    for packed in recording:
+        controls, command = unpack_controls(packed)
+        apply_command(world, command)
+        world.step(recording.dt, *controls)
+        steps += 1
+        if world.won:
+            break
+    elapsed = time.perf_counter() - start
+    return {
+        "steps": steps,
+        "sim_seconds": steps * recording.dt,
+        "wall_seconds": elapsed,
+        "steps_per_second": steps / elapsed if elapsed > 0 else float("inf"),
+        "speedup": steps * recording.dt / elapsed if elapsed > 0 else float("inf"),
+        "won": world.won,
+        "level": world.level_num,
+        "player_rect": tuple(world.player.rect),
+        "player_health": world.player.health,
+    }
+
+
+# -------------- Rendering --------------
+def draw_world(screen, world, static_layer, draw_stats, profiler=NullProfiler(), clips=None):
+    # clips: only redraw these screen rects. Entities are culled against
+    # their union and queued once; the background, terrain and that one
+    # batch are then drawn once per clip rect.
+    camera = world.camera
+    draw_stats.reset()
+    if clips is None:
+        view = camera.visible_rect()
+    else:
+        area = clips[0].unionall(clips[1:])
+        view = area.move(int(camera.x), int(camera.y)).inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+
+    # Only queue entities that overlap the view, then draw them all with one
+    # blits call
+    sprites = get_sprites()
+    batch = []
+    queue_visible(batch, camera, world.powerups, view, draw_stats, sprites.powerup)
+    profiler.mark("draw_powerups")
+    world.enemies.queue_sprites(batch, camera, view, draw_stats, sprites)
+    profiler.mark("draw_enemies")
+    queue_visible(batch, camera, world.shooters, view, draw_stats, sprites.shooter)
+    profiler.mark("draw_shooters")
+    world.projectiles.queue_sprites(batch, camera, view, draw_stats, sprites)
+    profiler.mark("draw_projectiles")
+    queue_visible(batch, camera, world.spikes, view, draw_stats, sprites.spike)
+    profiler.mark("draw_spikes")
+    queue_visible(batch, camera, world.flags, view, draw_stats, sprites.flag)
+    profiler.mark("draw_flags")
+
+    player = world.player
+    # Flicker during invulnerability, same as Player.draw
+    if not (player.invuln_timer > 0 and int(player.invuln_timer * 20) % 2 == 0):
+        batch.append((sprites.player_sprite(player), (player.rect.x - int(camera.x), player.rect.y - int(camera.y))))
+    profiler.mark("draw_player")
+
+    for clip in clips or (None,):
+        screen.set_clip(clip)
+        area = screen.get_clip()
+        screen.fill(BG_COLOR, area)
+
+        # Parallax background, just the stripes inside the clip
         stripe_h = 80
         for i in range(0, HEIGHT // stripe_h + 2):
             y = i * stripe_h - int(camera.y * 0.15) % stripe_h
-            pygame.draw.rect(screen, (24, 24, 34), (0, y, WIDTH, stripe_h))
-
-        for s in solids:
-            s.draw(screen, camera)
-        for p in powerups:
-            p.draw(screen, camera)
-        for e in enemies:
-            e.draw(screen, camera)
-        for s in shooters:
-            s.draw(screen, camera)
-        for proj in projectiles:
-            proj.draw(screen, camera)
-        for spike in spikes:
-            spike.draw(screen, camera)
-        for f in flags:
-            f.draw(screen, camera)
-
-        player.draw(screen, camera)
-
-        # --- UI ---
+            if y < area.bottom and y + stripe_h > area.top:
+                pygame.draw.rect(screen, (24, 24, 34), (0, y, WIDTH, stripe_h))
+        profiler.mark("draw_background")
+
+        static_layer.draw(screen, camera)
+        profiler.mark("draw_terrain")
+        screen.blits(batch, doreturn=False)
+        profiler.mark("draw_sprites")
+    screen.set_clip(None)
+
+
+class RenderInterpolator:
+    # The simulation runs at a fixed rate and frames land between its
+    # steps. capture() saves what moves right before a step; blend() moves
+    # the world alpha of the way from that state to the current one for
+    # drawing, and restore() puts the simulation state back.
+    def __init__(self):
+        self.prev = None
+        self.saved = None
+
+    def capture(self, world):
+        projectiles = world.projectiles
+        self.prev = (world.generation, world.player.rect.topleft, world.camera.x, world.camera.y,
+                     world.enemies.pos.copy(), projectiles.pos.copy(), projectiles.alive.copy())
+
+    def blend(self, world, alpha):
+        prev = self.prev
+        if prev is None or prev[0] != world.generation:
+            return  # nothing to blend from across a reset or level change
+        _, (px, py), cx, cy, enemy_pos, shot_pos, shot_alive = prev
+        player, camera, enemies, projectiles = world.player, world.camera, world.enemies, world.projectiles
+        self.saved = (player.rect.topleft, camera.x, camera.y, enemies.pos, projectiles.pos)
+
+        player.rect.topleft = (round(px + (player.rect.x - px) * alpha), round(py + (player.rect.y - py) * alpha))
+        camera.x = cx + (camera.x - cx) * alpha
+        camera.y = cy + (camera.y - cy) * alpha
+        enemies.pos = enemy_pos + (enemies.pos - enemy_pos) * alpha
+        # Only slots alive in both states are the same projectile
+        both = shot_alive & projectiles.alive
+        pos = projectiles.pos.copy()
+        pos[both] = shot_pos[both] + (pos[both] - shot_pos[both]) * alpha
+        projectiles.pos = pos
+
+    def restore(self, world):
+        if self.saved is None:
+            return
+        topleft, world.camera.x, world.camera.y, world.enemies.pos, world.projectiles.pos = self.saved
+        world.player.rect.topleft = topleft
+        self.saved = None
+
+
+class DirtyRectRenderer:
+    # Optional renderer for software displays. While the camera offset is
+    # unchanged it only redraws the areas that moving entities and the HUD
+    # covered last frame or cover now, and pushes just those with
+    # pygame.display.update(rects). Any camera move or level change falls
+    # back to a full frame.
+    def __init__(self, max_rects=16):
+        self.max_rects = max_rects  # past this many, redraw their union instead
+        self.last_camera = None
+        self.last_generation = None
+        self.last_rects = []
+        self.full_frames = 0
+        self.partial_frames = 0
+
+    def moving_rects(self, world):
+        # Screen rects of everything that can move or vanish between frames
+        cam_x, cam_y = int(world.camera.x), int(world.camera.y)
+        screen_rect = pygame.Rect(0, 0, WIDTH, HEIGHT)
+        rects = [world.player.rect.move(-cam_x, -cam_y)]
+        rects += [p.rect.move(-cam_x, -cam_y) for p in world.powerups]
+
+        enemies = world.enemies
+        for x, y in enemies.pos[enemies.patrol]:
+            rects.append(pygame.Rect(int(x) - cam_x, int(y) - cam_y, *ENEMY_SIZE))
+        for x, y in world.projectiles.pos[world.projectiles.alive]:
+            rects.append(pygame.Rect(int(x) - cam_x, int(y) - cam_y, PROJECTILE_SIZE, PROJECTILE_SIZE))
+        return [r.inflate(4, 4) for r in rects if r.colliderect(screen_rect)]
+
+    def render(self, screen, world, static_layer, draw_stats, profiler, draw_ui):
+        # draw_ui() draws the HUD on top and returns the screen rects it covered
+        camera_key = (int(world.camera.x), int(world.camera.y))
+        moving = self.moving_rects(world)
+
+        if camera_key != self.last_camera or world.generation != self.last_generation:
+            draw_world(screen, world, static_layer, draw_stats, profiler)
+            ui_rects = draw_ui()
+            profiler.mark("draw_hud")
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            # Clear what moved away (and the old HUD text), redraw what's there now
+            dirty = self.last_rects + moving
+            if len(dirty) > self.max_rects:
+                dirty = [dirty[0].unionall(dirty[1:])]
+            draw_world(screen, world, static_layer, draw_stats, profiler, clips=dirty)
+            ui_rects = draw_ui()
+            profiler.mark("draw_hud")
+            pygame.display.update(dirty + ui_rects)
+            self.partial_frames += 1
+        profiler.mark("flip")
+
+        self.last_camera = camera_key
+        self.last_generation = world.generation
+        self.last_rects = moving + ui_rects
+
+
+# -------------- Main --------------
+def main(profile_csv=None, record_path=None, replay=None, dirty_rects=False, sim_rate=SIM_RATE, fps=FPS,
+         rewind_seconds=0):
+    # record_path: save this session's input for replay. replay: an
+    # InputRecording to play back instead of the keyboard. The simulation
+    # steps at a fixed 1 / sim_rate (a replay's own dt) however fast frames
+    # render, and recordings hold one tick per step so replays are
+    # deterministic. fps caps rendering, 0 for uncapped. rewind_seconds is
+    # how far Backspace can go back, 0 (the default) for no rewinding. A
+    # snapshot every step costs more than the step itself, so it's opt-in,
+    # and it is always off while recording or replaying since it isn't part
+    # of the input.
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(TITLE)
+    clock = pygame.time.Clock()
+    font = get_font("verdana", 16)
+    text_cache = TextCache()
+
+    if replay is not None:
+        world = World(replay.level_num)
+        replay_ticks = iter(replay)
+    else:
+        world = World(current_level)
+    sim_dt = replay.dt if replay is not None else 1.0 / sim_rate
+    recording = InputRecording(world.level_num, sim_dt) if record_path else None
+    rewind = None
+    if rewind_seconds > 0 and replay is None and recording is None:
+        rewind = RewindBuffer(rewind_seconds, 1.0 / sim_dt)
+    accumulator = 0.0
+    interpolator = RenderInterpolator()
+    # Key presses and commands wait for the next sim step so none are lost
+    # on frames that don't step
+    pending_shrink = False
+    pending_command = CMD_NONE
+    static_layer = None
+    layer_level = None
+    draw_stats = DrawStats()
+    profiler = world.profiler = FrameProfiler()
+    world.enable_preloading(LevelPreloader())
+    overlay = ProfilerOverlay(profiler)
+    overlay_font = get_font("consolas", 13)
+
+    dirty_renderer = DirtyRectRenderer() if dirty_rects else None
+
+    def draw_ui():
+        # HUD text, health bar and profiler overlay; returns the screen rects drawn
+        player = world.player
         pad = 10
         info = [
-            f"FPS: {clock.get_fps():.0f}  Level: {current_level}",
+            f"FPS: {clock.get_fps():.0f}  Level: {world.level_num}  Drawn: {draw_stats.drawn}  Culled: {draw_stats.culled}",
             "Move: ← → or A/D   Jump: Space/W/↑   Shrink: S/↓",
-            "Reset: R   Quit: Esc or Q",
+            "Reset: R   Quit: Esc or Q   Profiler: F3 (F4 saves CSV)",
         ]
+        if rewind is not None:
+            info.append(f"Rewind: hold Backspace ({len(rewind) * sim_dt:.1f}s stored)")
         if player.is_small:
             info.append(f"Small mode: {player.shrink_timer:.1f}s remaining")
 
+        rects = []
         for i, line in enumerate(info):
-            screen.blit(font.render(line, True, (200, 200, 210)), (pad, pad + i * 18))
+            # Unchanged lines come straight from the cache
+            rects.append(screen.blit(text_cache.render(font, line, (200, 200, 210)), (pad, pad + i * 18)))
 
         # Health bar
         bar_w, bar_h = 200, 20
@@ -731,13 +2435,188 @@ def main():
         pygame.draw.rect(screen, (100, 0, 0), (bx, by, bar_w, bar_h))
         ratio = player.health / player.max_health
         pygame.draw.rect(screen, (255, 0, 0), (bx, by, int(bar_w * ratio), bar_h))
-        pygame.draw.rect(screen, (255, 255, 255), (bx, by, bar_w, bar_h), 2)
+        rects.append(pygame.draw.rect(screen, (255, 255, 255), (bx, by, bar_w, bar_h), 2))
+
+        if overlay.visible:
+            rects.append(overlay.draw(screen, overlay_font, text_cache))
+        return rects
+
+    running = True
+    while running:
+        accumulator += clock.tick(fps) / 1000.0
+        profiler.begin_frame()
 
-        pygame.display.flip()
+        jump_pressed = False
+        shrink_pressed = False
+        input_dir = 0
+        command = CMD_NONE
+
+        for e in pygame.event.get():
+            if e.type == pygame.QUIT:
+                running = False
+            elif e.type == pygame.KEYDOWN:
+                if e.key in (pygame.K_ESCAPE, pygame.K_q):
+                    running = False
+                if e.key == pygame.K_r:
+                    command = CMD_RESET
+                if e.key == pygame.K_1:
+                    command = CMD_LEVEL_1
+                if e.key == pygame.K_2:
+                    command = CMD_LEVEL_2
+                if e.key == pygame.K_s or e.key == pygame.K_DOWN:
+                    shrink_pressed = True
+                if e.key == pygame.K_F3:
+                    overlay.visible = not overlay.visible
+                if e.key == pygame.K_F4:
+                    path = time.strftime("profile_%Y%m%d_%H%M%S.csv")
+                    profiler.export_csv(path)
+                    print(f"Frame profile written to {path}")
 
+        # Continuous input
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+            input_dir -= 1
+        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+            input_dir += 1
+        if keys[pygame.K_SPACE] or keys[pygame.K_w] or keys[pygame.K_UP]:
+            jump_pressed = True
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            shrink_pressed = True
+        up = keys[pygame.K_UP] or keys[pygame.K_w]
+        down = keys[pygame.K_DOWN] or keys[pygame.K_s]
+        rewinding = rewind is not None and keys[pygame.K_BACKSPACE]
+
+        pending_shrink = pending_shrink or shrink_pressed
+        if command != CMD_NONE:
+            pending_command = command
+        profiler.mark("events")
+
+        steps = min(int(accumulator / sim_dt), MAX_CATCH_UP_STEPS)
+        if steps == MAX_CATCH_UP_STEPS:
+            accumulator = steps * sim_dt  # drop the rest rather than spiral
+        for i in range(steps):
+            if rewinding:
+                # One stored step back per sim step. Input is ignored meanwhile
+                # but R/1/2 and shrink presses stay queued for the next step.
+                if i == steps - 1:
+                    interpolator.capture(world)
+                accumulator -= sim_dt
+                blob = rewind.pop()
+                if blob is not None:
+                    world.restore(blob)
+                continue
+            controls = (input_dir, jump_pressed, pending_shrink, up, down)
+            command, pending_command, pending_shrink = pending_command, CMD_NONE, False
+            if replay is not None:
+                packed = next(replay_ticks, None)
+                if packed is None:
+                    running = False  # replay finished
+                    break
+                controls, command = unpack_controls(packed)
+            elif recording is not None:
+                recording.append(pack_controls(*controls, command))
+            if i == steps - 1:
+                interpolator.capture(world)
+            accumulator -= sim_dt
+            if rewind is not None:
+                # The state before this step, so the first pop goes back one
+                rewind.push(world.snapshot())
+            apply_command(world, command)
+            world.step(sim_dt, *controls)
+            if world.won:
+                break
+        if not running:
+            break
+
+        if world.won:
+            print("🎉 You win! Congratulations! 🎉")
+            # Display a "You Win" message on screen before quitting
+            font = get_font("verdana", 40)
+            win_text = font.render("YOU WIN! CONGRATULATIONS!", True, (255, 255, 0))
+            screen.fill((0, 0, 0))
+            text_rect = win_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+            screen.blit(win_text, text_rect)
+            pygame.display.flip()
+            pygame.time.delay(4000)  # wait 4 seconds
+            break  # exit the main loop
+
+        if layer_level is not world.level:
+            # Restarts and rewinds keep the level, so its baked terrain stays
+            static_layer = world.level.static_layer
+            if static_layer is None:
+                static_layer = world.level.static_layer = StaticLayer(world.level.tiles)
+            else:
+                static_layer.convert_chunks()
+            layer_level = world.level
+
+        # ---------- Draw ----------
+        # Entities are drawn between the last two sim states
+        interpolator.blend(world, accumulator / sim_dt)
+        if dirty_renderer is not None:
+            dirty_renderer.render(screen, world, static_layer, draw_stats, profiler, draw_ui)
+        else:
+            draw_world(screen, world, static_layer, draw_stats, profiler)
+            draw_ui()
+            profiler.mark("draw_hud")
+            pygame.display.flip()
+            profiler.mark("flip")
+        interpolator.restore(world)
+        profiler.end_frame()
+
+    if profile_csv:
+        profiler.export_csv(profile_csv)
+    if recording is not None:
+        recording.save(record_path)
+        print(f"Recorded {recording.ticks} ticks to {record_path}")
     pygame.quit()
     sys.exit()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--headless", action="store_true", help="run the simulation without a window")
+    parser.add_argument("--level", type=int, default=1, help="level to start on")
+    parser.add_argument("--seconds", type=float, default=60.0, help="simulated seconds to run headless")
+    parser.add_argument("--dt", type=float, default=HEADLESS_DT, help="fixed headless step in seconds")
+    parser.add_argument("--script", help="input script file for headless runs")
+    parser.add_argument("--profile-csv", help="write per-phase frame timings to this CSV on exit")
+    parser.add_argument("--record", help="record this session's input to a file")
+    parser.add_argument("--replay", help="replay a recorded input file (headless unless --watch)")
+    parser.add_argument("--watch", action="store_true", help="show a --replay in a window at normal speed")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only redraw changed areas while the camera is still (software displays)")
+    parser.add_argument("--sim-rate", type=float, default=SIM_RATE, help="simulation steps per second")
+    parser.add_argument("--fps", type=int, default=FPS, help="render frame cap, 0 for uncapped")
+    parser.add_argument("--rewind", type=float, nargs="?", default=0, const=REWIND_SECONDS,
+                        help=f"let Backspace rewind this many seconds of play (default {REWIND_SECONDS:g} "
+                             "when given without a value), off if not given")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    recording = None
+    if args.replay:
+        try:
+            recording = InputRecording.load(args.replay)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Can't replay {args.replay}: {e}")
+    if args.replay and not args.watch:
+        result = run_replay(recording)
+        print(f"Replayed {result['steps']} steps ({result['sim_seconds']:.1f} simulated s) in "
+              f"{result['wall_seconds']:.3f} s, {result['speedup']:.0f}x real time")
+        print(f"Level {result['level']}, player at {result['player_rect']}, health {result['player_health']}"
+              + (", won" if result["won"] else ""))
+    elif args.replay:
+        main(profile_csv=args.profile_csv, replay=recording, dirty_rects=args.dirty_rects,
+             fps=args.fps)
+    elif args.headless:
+        script = load_input_script(args.script) if args.script else default_input_script
+        result = run_headless(args.level, int(args.seconds / args.dt), args.dt, script)
+        print(f"{result['steps']} steps ({result['sim_seconds']:.1f} simulated s) in "
+              f"{result['wall_seconds']:.3f} s: {result['steps_per_second']:.0f} steps/s, "
+              f"{result['wins']} wins, peak {result['peak_projectiles']} projectiles")
+    else:
+        current_level = args.level
+        main(profile_csv=args.profile_csv, record_path=args.record, dirty_rects=args.dirty_rects,
+             sim_rate=args.sim_rate, fps=args.fps, rewind_seconds=args.rewind)
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+# Render benchmarks run without a real window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import Test
+
+# -------------- Config --------------
+# name -> (cols, rows, enemies). "current" matches the shipped ~118 column maps.
+SIZES = {
+    "current": (118, 20, 12),
+    "medium": (500, 100, 200),
+    "large": (2000, 500, 2000),
+    "huge": (4000, 1000, 5000),
+}
+DEFAULT_SIZES = ("current", "medium", "large")
+SIM_STEPS = 600
+RENDER_FRAMES = 120
+
+
+# -------------- Level generator --------------
+def generate_level(cols, rows, enemies=0, seed=0):
+    # Synthetic map in the same character format build_level consumes:
+    # a two tile border, a floor every FLOOR_GAP rows with pits and ladders,
+    # spikes and powerups on the floors, then `enemies` 'E'/'C'/'F' spread
+    # over the open cells. 'P' starts top left, 'G' sits bottom right.
+    rng = random.Random(seed)
+    grid = [["-"] * cols for _ in range(rows)]
+    for y in range(rows):
+        for x in (0, 1, cols - 2, cols - 1):
+            grid[y][x] = "#"
+    for x in range(cols):
+        for y in (0, 1, rows - 2, rows - 1):
+            grid[y][x] = "#"
+
+    floor_gap = 6
+    floors = list(range(2 + floor_gap, rows - 2, floor_gap))
+    for fy in floors:
+        x = 2
+        while x < cols - 2:
+            run = rng.randint(8, 30)
+            for fx in range(x, min(x + run, cols - 2)):
+                grid[fy][fx] = "#"
+            # One ladder per run, climbing up to the floor above
+            lx = rng.randint(x, min(x + run, cols - 3))
+            for ly in range(fy - floor_gap + 1, fy + 1):
+                if grid[ly][lx] == "-" or ly == fy:
+                    grid[ly][lx] = "L"
+            x += run + rng.randint(2, 4)  # pit
+
+    open_cells = [(x, fy - 1) for fy in floors for x in range(2, cols - 3)
+                  if grid[fy][x] == "#" and grid[fy - 1][x] == "-"]
+    rng.shuffle(open_cells)
+
+    def place(ch, count):
+        for _ in range(count):
+            if not open_cells:
+                return
+            x, y = open_cells.pop()
+            grid[y][x] = ch
+
+    place("^", len(open_cells) // 40)
+    for ch in "JSH":
+        place(ch, max(1, len(open_cells) // 200))
+    place("E", enemies // 3)
+    place("C", enemies // 3)
+    place("F", enemies - 2 * (enemies // 3))
+
+    grid[2 + floor_gap - 1][3] = "P"
+    grid[rows - 3][cols - 4] = "G"
+    return ["".join(row) for row in grid]
+
+
+# -------------- Measurements --------------
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_build(level_map, cache_dir):
+    # Cold build compiles and writes the cache, warm build loads it back
+    _, compile_s = timed(Test.compile_level, level_map)
+    _, cold_s = timed(Test.build_level, 0, level_map, cache_dir)
+    level, warm_s = timed(Test.build_level, 0, level_map, cache_dir)
+
+    tracemalloc.start()
+    Test.build_level(0, level_map, cache_dir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "tiles": level.rows * level.cols,
+        "solids": len(level.solids),
+        "entities": len(level.powerups) + len(level.enemies) + len(level.shooters) + len(level.spikes) + len(level.flags),
+        "compile_s": compile_s,
+        "build_cold_s": cold_s,
+        "build_warm_s": warm_s,
+        "build_peak_mb": peak / 2 ** 20,
+    }
+
+
+def bench_sim(level_map, cache_dir, steps):
+    world = Test.World(0, level_map, cache_dir)
+    times = np.zeros(steps)
+    for i in range(steps):
+        controls = Test.default_input_script(i)
+        start = time.perf_counter()
+        world.step(Test.HEADLESS_DT, *controls)
+        times[i] = time.perf_counter() - start
+    return {
+        "step_mean_ms": times.mean() * 1000,
+        "step_p95_ms": np.percentile(times, 95) * 1000,
+        "steps_per_second": steps / times.sum(),
+    }
+
+
+def bench_render(level_map, cache_dir, frames):
+    screen = pygame.display.set_mode((Test.WIDTH, Test.HEIGHT))
+    world = Test.World(0, level_map, cache_dir)
+    layer, layer_s = timed(Test.StaticLayer, world.level.tiles)
+    stats = Test.DrawStats()
+
+    # Sweep the camera across the level so chunk baking is included
+    times = np.zeros(frames)
+    max_x = max(0, world.level.world_w - Test.WIDTH)
+    max_y = max(0, world.level.world_h - Test.HEIGHT)
+    for i in range(frames):
+        world.camera.x = max_x * i / max(1, frames - 1)
+        world.camera.y = max_y * i / max(1, frames - 1)
+        start = time.perf_counter()
+        Test.draw_world(screen, world, layer, stats)
+        times[i] = time.perf_counter() - start
+    return {
+        "static_layer_s": layer_s,
+        "render_mean_ms": times.mean() * 1000,
+        "render_p95_ms": np.percentile(times, 95) * 1000,
+    }
+
+
+def run(sizes, steps=SIM_STEPS, frames=RENDER_FRAMES, seed=0):
+    pygame.init()
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in sizes:
+            cols, rows, enemies = SIZES[name]
+            level_map, gen_s = timed(generate_level, cols, rows, enemies, seed)
+            print(f"{name}: {cols}x{rows}, {enemies} enemies", flush=True)
+            result = {"size": name, "cols": cols, "rows": rows, "enemies": enemies, "generate_s": gen_s}
+            result.update(bench_build(level_map, cache_dir))
+            result.update(bench_sim(level_map, cache_dir, steps))
+            result.update(bench_render(level_map, cache_dir, frames))
+            for key, value in result.items():
+                if isinstance(value, float):
+                    print(f"  {key:<18}{value:12.4f}")
+            results.append(result)
+    pygame.quit()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    # Ratio of new / baseline for every shared numeric metric (<1 is faster)
+    old = {r["size"]: r for r in baseline["results"]}
+    for result in report["results"]:
+        base = old.get(result["size"])
+        if base is None:
+            continue
+        print(f"{result['size']} vs baseline:")
+        for key, value in result.items():
+            if isinstance(value, float) and base.get(key):
+                print(f"  {key:<18}{value / base[key]:8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Platformer performance benchmarks")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES),
+                        help=f"comma separated subset of {', '.join(SIZES)}")
+    parser.add_argument("--steps", type=int, default=SIM_STEPS, help="simulation steps per size")
+    parser.add_argument("--frames", type=int, default=RENDER_FRAMES, help="rendered frames per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    report = run(sizes, args.steps, args.frames, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pytest
+
+import Test
+
+RATES = (30, 50, 60, 75, 120, 144, 240)
+
+
+def patrols():
+    # The shipped patrol plus a few odd distances, speeds and start positions
+    enemies = [Test.PatrolEnemy((x, 100), patrol_distance=d, speed=v)
+               for x, d, v in ((102, 300, 120), (6, 300, 120), (1000, 250, 90), (4850, 77, 333), (37, 1, 500))]
+    return enemies + [Test.Enemy((500, 100))]
+
+
+@pytest.mark.parametrize("rate", RATES)
+@pytest.mark.parametrize("chunk", (4, 7, 1000))
+def test_patrol_catch_up_matches_stepping(rate, chunk):
+    # Near-band rows advance several steps at a time; they have to end up
+    # exactly where stepping update(dt) every step puts them
+    dt = 1.0 / rate
+    stepped = Test.EnemyBatch(patrols())
+    advanced = Test.EnemyBatch(patrols())
+    rows = np.arange(advanced.count)
+    steps = 0
+    while steps < 20000:
+        for _ in range(chunk):
+            stepped.update(dt)
+        advanced.advance(rows, np.full(advanced.count, chunk), dt)
+        steps += chunk
+        assert np.array_equal(stepped.pos, advanced.pos), f"positions differ after {steps} steps"
+        assert np.array_equal(stepped.direction, advanced.direction), f"directions differ after {steps} steps"
+
+
+def test_patrol_catch_up_after_dt_change():
+    # A row stepped at another dt isn't on this dt's cycle and falls back
+    # to stepping
+    stepped = Test.EnemyBatch(patrols())
+    advanced = Test.EnemyBatch(patrols())
+    for batch in (stepped, advanced):
+        for _ in range(37):
+            batch.update(1.0 / 50)
+    for _ in range(9):
+        stepped.update(1.0 / 60)
+    advanced.advance(np.arange(advanced.count), np.full(advanced.count, 9), 1.0 / 60)
+    assert np.array_equal(stepped.pos, advanced.pos)
+    assert np.array_equal(stepped.direction, advanced.direction)
+
+
+@pytest.mark.parametrize("level_num, level_map", [
+    (1, None), (3, None),
+    (0, ["##########", "#P------G#", "##########"]),  # no powerups, enemies or shooters
+])
+def test_snapshot_restore_round_trip(level_num, level_map):
+    world = Test.World(level_num, level_map)
+    for i in range(300):
+        world.step(Test.HEADLESS_DT, *Test.default_input_script(i))
+    blob = world.snapshot()
+    after = []
+    for i in range(300, 600):
+        world.step(Test.HEADLESS_DT, *Test.default_input_script(i))
+        after.append(world.snapshot())
+    # Restoring and replaying the same input has to retrace every step
+    world.restore(blob)
+    assert world.snapshot() == blob
+    for i in range(300, 600):
+        world.step(Test.HEADLESS_DT, *Test.default_input_script(i))
+        assert world.snapshot() == after[i - 300], f"diverged at step {i}"
+
+
+def test_jump_stops_at_nearest_ceiling_at_low_tick_rate():
+    # At 10 Hz the jump crosses the whole 2-tile ceiling in one step and
+    # ends up overlapping the run above it too. The player has to stop under
+    # the ceiling it reached first, not under whichever solid came first.
+    level_map = [
+        "##########",
+        "#--------#",
+        "#--------#",
+        "##########",
+        "#--##----#",
+        "#--------#",
+        "#--------#",
+        "#--------#",
+        "#--P-----#",
+        "##########",
+    ]
+    level = Test.build_level(0, level_map)
+    player = Test.Player(level.player_start)
+    player.rect.topleft = (148, 250)
+    player.vel.y = -800
+    player.update(0.1, level, 0, False, False, False, False)
+    assert player.rect.top == 4 * Test.TILE_SIZE + Test.TILE_SIZE
+    assert not any(player.rect.colliderect(s.rect) for s in level.solids if not s.is_ladder)
+
+
+def recorded_run(steps=900):
+    # Plays level 1 with the headless script plus a restart and a level
+    # switch, recording every tick like main() does
+    recording = Test.InputRecording(1, Test.HEADLESS_DT)
+    world = Test.World(1)
+    commands = {300: Test.CMD_RESET, 600: Test.CMD_LEVEL_2}
+    for i in range(steps):
+        controls = Test.default_input_script(i)
+        command = commands.get(i, Test.CMD_NONE)
+        recording.append(Test.pack_controls(*controls, command))
+        Test.apply_command(world, command)
+        world.step(recording.dt, *controls)
+    return recording, world
+
+
+def test_recording_round_trip():
+    recording = Test.InputRecording(2, 1.0 / 144)
+    ticks = []
+    # Every control and command combination, and runs long enough to need
+    # two and three varint bytes
+    for packed in range(256):
+        ticks += [packed] * (1 + packed % 3)
+    ticks += [5] * 200 + [17] * 20000 + [0]
+    for packed in ticks:
+        recording.append(packed)
+    parsed = Test.InputRecording.from_bytes(recording.to_bytes())
+    assert (parsed.level_num, parsed.dt, parsed.ticks) == (2, 1.0 / 144, len(ticks))
+    assert list(parsed) == ticks
+    for packed in range(256):
+        assert Test.pack_controls(*Test.unpack_controls(packed)[0], Test.unpack_controls(packed)[1]) == packed
+
+
+def test_truncated_recording_raises_value_error():
+    blob = recorded_run(300)[0].to_bytes()
+    for n in range(len(blob)):
+        with pytest.raises(ValueError):
+            Test.InputRecording.from_bytes(blob[:n])
+
+
+def test_replay_reproduces_recorded_run():
+    recording, world = recorded_run()
+    result = Test.run_replay(Test.InputRecording.from_bytes(recording.to_bytes()))
+    assert result["steps"] == recording.ticks
+    assert result["level"] == world.level_num
+    assert result["player_rect"] == tuple(world.player.rect)
+    assert result["player_health"] == world.player.health
+
+
+def parse_map(level_map):
+    # Straightforward reference parse: tile codes, spawns in row-major order
+    # and world bounds
+    cols = max(len(row) for row in level_map)
+    grid = np.zeros((len(level_map), cols), dtype=np.uint8)
+    spawns = []
+    for y, row in enumerate(level_map):
+        for x, ch in enumerate(row):
+            grid[y, x] = Test.TILE_CODES.get(ch, Test.TILE_EMPTY)
+            if grid[y, x] >= Test.FIRST_SPAWN_CODE:
+                spawns.append((grid[y, x], 1 if x > len(row) / 2 else -1, x, y))
+    return grid, spawns, (cols * Test.TILE_SIZE, len(level_map) * Test.TILE_SIZE)
+
+
+def assert_matches_map(compiled, level_map):
+    grid, spawns, bounds = parse_map(level_map)
+    assert np.array_equal(compiled.grid, grid)
+    assert [tuple(int(v) for v in s) for s in compiled.spawns[["code", "dir", "x", "y"]]] == spawns
+    assert (compiled.world_w, compiled.world_h) == bounds
+
+
+@pytest.mark.parametrize("num", sorted(Test.LEVEL_MAPS))
+def test_compiled_level_matches_map(num, tmp_path):
+    level_map = Test.LEVEL_MAPS[num]
+    mapped = Test.get_compiled_level(level_map, str(tmp_path))
+    assert isinstance(mapped.grid, np.memmap)
+    assert_matches_map(mapped, level_map)
+    assert_matches_map(Test.compiled_level_from_bytes(Test.compile_level(level_map)), level_map)
+    # A cache dir that can't be created falls back to the in-memory level
+    blocker = tmp_path / "file"
+    blocker.write_bytes(b"")
+    in_memory = Test.get_compiled_level(level_map, str(blocker / "cache"))
+    assert not isinstance(in_memory.grid, np.memmap)
+    assert_matches_map(in_memory, level_map)
+
+
+@pytest.mark.parametrize("damage", ["garbage", "old version", "truncated", "empty"])
+def test_bad_level_cache_file_is_recompiled(damage, tmp_path):
+    level_map = Test.LEVEL_MAPS[1]
+    data = Test.compile_level(level_map)
+    path = tmp_path / (Test.level_cache_key(level_map) + ".lvl")
+    if damage == "garbage":
+        path.write_bytes(bytes(range(256)) * 8)
+    elif damage == "old version":
+        path.write_bytes(data[:4] + (Test.LEVEL_FORMAT_VERSION + 1).to_bytes(2, "little") + data[6:])
+    elif damage == "truncated":
+        path.write_bytes(data[:len(data) // 2])
+    else:
+        path.write_bytes(b"")
+    assert_matches_map(Test.get_compiled_level(level_map, str(tmp_path)), level_map)
+    assert path.read_bytes() == data
+
+
+def assert_exact_cover(mask):
+    # Every solid tile in exactly one merged rect, nothing else covered
+    covered = np.zeros(mask.shape, dtype=int)
+    for x, y, w, h in Test.merge_solid_tiles(mask):
+        assert w > 0 and h > 0
+        covered[y:y + h, x:x + w] += 1
+    assert np.array_equal(covered, mask.astype(int))
+
+
+@pytest.mark.parametrize("num", sorted(Test.LEVEL_MAPS))
+def test_merged_solids_cover_shipped_maps_exactly(num):
+    tiles = Test.get_compiled_level(Test.LEVEL_MAPS[num]).grid
+    assert_exact_cover(np.asarray(tiles) == Test.TILE_SOLID)
+
+
+@pytest.mark.parametrize("density", (0.1, 0.5, 0.9))
+def test_merged_solids_cover_random_masks_exactly(density):
+    rng = np.random.default_rng(int(density * 10))
+    for _ in range(50):
+        rows, cols = rng.integers(1, 40, size=2)
+        assert_exact_cover(rng.random((rows, cols)) < density)
+    assert_exact_cover(np.ones((7, 9), dtype=bool))
+    assert_exact_cover(np.zeros((7, 9), dtype=bool))
@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import argparse
+import heapq
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+import Test
+
+# -------------- Config --------------
+# The search steps the real Player.update at a fixed dt. Each action is a
+# macro (walk, jump with an optional mid-air double jump, climb, shrink)
+# that runs until the player is standing or climbing again, so the graph
+# mostly holds stable states, and states in the same coarse bucket merge.
+SEARCH_DT = 1.0 / 60
+WALK_FRAMES = 8
+CLIMB_FRAMES = 12
+MAX_MACRO_FRAMES = 120
+DOUBLE_JUMP_FRAMES = (12, 24)  # frames after the first jump to try the second
+CELL = 16  # px per position bucket
+VEL_BUCKET = 400  # px/s per vertical velocity bucket for airborne states
+# Default state budget per search, which keeps a default run to seconds
+# per level. Levels with long routes come back UNKNOWN; raise it with
+# --max-states for a full check.
+MAX_STATES = 2000
+
+# Search results. BUDGET means the state limit was hit first, so the
+# level may or may not be finishable.
+FINISHABLE = "finishable"
+UNREACHABLE = "unreachable"
+BUDGET = "budget"
+
+# Powerups that change what the player can reach. Health pickups never do
+# since hazards are ignored by the search (see explore()).
+ABILITY_POWERUPS = ("double", "shrink")
+
+PLAYER_FIELDS = (
+    "vel", "on_ground", "facing", "can_double_jump", "has_double_jump", "can_shrink", "jump_was_pressed",
+    "is_colliding_ladder", "is_small", "shrink_timer", "last_y", "health", "invuln_timer",
+)
+
+
+# -------------- Search --------------
+def save_player(player):
+    fields = [getattr(player, name) for name in PLAYER_FIELDS]
+    fields[0] = (player.vel.x, player.vel.y)
+    return tuple(player.rect), tuple(fields)
+
+
+def load_player(player, state):
+    rect, fields = state
+    player.rect = pygame.Rect(rect)
+    for name, value in zip(PLAYER_FIELDS, fields):
+        setattr(player, name, value)
+    player.vel = pygame.Vector2(fields[0])
+
+
+def state_key(player):
+    airborne = not player.on_ground
+    return (
+        player.rect.x // CELL, player.rect.y // CELL, int(player.vel.y // VEL_BUCKET) if airborne else 0,
+        player.is_colliding_ladder, player.has_double_jump and airborne,
+        player.is_small, int(player.shrink_timer), player.can_double_jump, player.can_shrink,
+    )
+
+
+def macros(player):
+    # (input_dir, jump, double jump frame, up, down). These follow the real
+    # key bindings: W/Up is both jump and climb, S/Down is both climb down
+    # and shrink.
+    for input_dir in (-1, 0, 1):
+        yield input_dir, False, None, False, False  # walk
+        yield input_dir, True, None, False, False  # tap jump
+        if player.can_double_jump:
+            for frame in DOUBLE_JUMP_FRAMES:
+                yield input_dir, True, frame, False, False
+        yield input_dir, True, None, True, False  # hold W: jump, then climb
+        if player.can_double_jump:
+            # Tap W, then press it again to double jump and hold it to grab
+            # a ladder that only the double jump reaches
+            for frame in DOUBLE_JUMP_FRAMES:
+                yield input_dir, True, frame, True, False
+    yield 0, False, None, False, True  # hold S
+
+
+class CachedGrid:
+    # Wraps a level's CollisionGrid for the search. A query's result only
+    # depends on the block of cells the rect covers, and the search asks
+    # for the same few thousand blocks millions of times.
+    def __init__(self, grid):
+        self.grid = grid
+        self.cache = {}
+
+    def query(self, rect):
+        cs = self.grid.cell_size
+        key = (rect.left // cs, (rect.right - 1) // cs, rect.top // cs, (rect.bottom - 1) // cs)
+        found = self.cache.get(key)
+        if found is None:
+            found = self.cache[key] = self.grid.query(rect)
+        return found
+
+
+def explore(level_map, disabled=(), max_states=MAX_STATES):
+    # Best-first search over player states from 'P', expanding states closest
+    # to a flag first. Returns (FINISHABLE, UNREACHABLE or BUDGET, states
+    # expanded, ability powerup types the player had at the flag);
+    # UNREACHABLE only once every reachable state bucket has been expanded,
+    # BUDGET if max_states ran out before that. Movement uses the real
+    # Player.update: gravity, air control, double jump, ladders and
+    # shrinking. Enemies, spikes, projectiles and fall damage are ignored;
+    # only falling out of the world ends a branch. Powerups whose type is in
+    # `disabled` can't be picked up.
+    level = Test.build_level(0, level_map)
+    level.grid = CachedGrid(level.grid)
+    pickups = [(p.rect, p.type) for p in level.powerups if p.type in ABILITY_POWERUPS and p.type not in disabled]
+    flags = [f.rect for f in level.flags]
+
+    def flag_distance(rect):
+        return min((abs(rect.centerx - f.centerx) + abs(rect.centery - f.centery) for f in flags), default=0)
+
+    player = Test.Player(level.player_start)
+    seen = {state_key(player)}
+    queue = [(flag_distance(player.rect), 0, save_player(player))]
+    explored = 0
+    while queue:
+        if len(seen) >= max_states:
+            return BUDGET, explored, ()
+        state = heapq.heappop(queue)[2]
+        explored += 1
+        load_player(player, state)
+        for input_dir, jumping, double_jump, up, down in list(macros(player)):
+            load_player(player, state)
+            # Holding W or S ends after CLIMB_FRAMES, but a double jump into a
+            # ladder runs like a jump, until the player lands or catches on
+            holding = (up and double_jump is None) or down
+            min_frames = CLIMB_FRAMES if holding else (2 if jumping else WALK_FRAMES)
+            for frame in range(MAX_MACRO_FRAMES):
+                if up:
+                    # W held throughout, or let go until the double jump
+                    climb = double_jump is None or frame == 0 or frame >= double_jump
+                    jump = climb
+                else:
+                    climb = False
+                    jump = jumping and (frame == 0 or frame == double_jump)
+                player.update(SEARCH_DT, level, input_dir, jump, down, climb, down)
+                for rect, kind in pickups:
+                    if player.rect.colliderect(rect):
+                        if kind == "double":
+                            player.can_double_jump = True
+                        else:
+                            player.can_shrink = True
+                if any(player.rect.colliderect(f) for f in flags):
+                    used = tuple(kind for kind, have in (("double", player.can_double_jump),
+                                                         ("shrink", player.can_shrink)) if have)
+                    return FINISHABLE, explored, used
+                if player.rect.top > level.world_h:
+                    break
+                if frame + 1 >= min_frames and (holding or player.on_ground or player.is_colliding_ladder):
+                    break
+            if player.rect.top > level.world_h:
+                continue
+            key = state_key(player)
+            if key not in seen:
+                seen.add(key)
+                heapq.heappush(queue, (flag_distance(player.rect), len(seen), save_player(player)))
+    return UNREACHABLE, explored, ()
+
+
+def run_job(job):
+    name, level_map, disabled, max_states = job
+    start = time.perf_counter()
+    status, explored, used = explore(level_map, disabled, max_states)
+    return name, disabled, status, used, explored, time.perf_counter() - start
+
+
+# -------------- Validation --------------
+def validate(levels, workers=None, max_states=MAX_STATES):
+    # levels: {name: level_map}. Every level is searched with all powerups,
+    # all levels in parallel across a process pool. A finishable level is
+    # searched again once per ability powerup type its route picked up, with
+    # that type disabled; the type is required if the level can't be
+    # finished without it. A type the route never picked up isn't required
+    # and needs no search.
+    for level_map in levels.values():
+        Test.get_compiled_level(level_map)  # warm the cache before forking
+
+    results = {name: {"status": BUDGET, "required": [], "undecided": [], "states": 0, "seconds": 0.0}
+               for name in levels}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(run_job, (name, level_map, (), max_states)) for name, level_map in levels.items()}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, disabled, status, used, explored, seconds = future.result()
+                report = results[name]
+                report["states"] += explored
+                report["seconds"] += seconds
+                if not disabled:
+                    report["status"] = status
+                    if status == FINISHABLE:
+                        pending |= {pool.submit(run_job, (name, levels[name], (kind,), max_states)) for kind in used}
+                elif status == UNREACHABLE:
+                    report["required"].append(disabled[0])
+                elif status == BUDGET:
+                    report["undecided"].append(disabled[0])
+    for report in results.values():
+        report["required"].sort()
+        report["undecided"].sort()
+    return results
+
+
+def load_map_file(path):
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every level's flag can be reached")
+    parser.add_argument("--levels", default=",".join(str(n) for n in Test.LEVEL_MAPS),
+                        help="comma separated built-in level numbers")
+    parser.add_argument("--map-file", action="append", default=[], help="extra level map text file, one row per line")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--max-states", type=int, default=MAX_STATES,
+                        help=f"state budget per search (default {MAX_STATES})")
+    args = parser.parse_args(argv)
+
+    levels = {}
+    for num in filter(None, args.levels.split(",")):
+        levels[f"level {num}"] = Test.LEVEL_MAPS[int(num)]
+    for path in args.map_file:
+        levels[path] = load_map_file(path)
+
+    start = time.perf_counter()
+    results = validate(levels, args.workers, args.max_states)
+    for name, report in results.items():
+        if report["status"] == FINISHABLE:
+            status = "finishable, required powerups: " + (", ".join(report["required"]) or "none")
+            if report["undecided"]:
+                status += f" (undecided: {', '.join(report['undecided'])}, search budget exceeded)"
+        elif report["status"] == UNREACHABLE:
+            status = "NOT FINISHABLE"
+        else:
+            status = f"UNKNOWN, search budget of {args.max_states} states exceeded"
+        print(f"{name}: {status} ({report['states']} states, {report['seconds']:.1f} s of search)")
+    print(f"Checked {len(levels)} levels in {time.perf_counter() - start:.1f} s")
+    return 0 if all(r["status"] == FINISHABLE for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
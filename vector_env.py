@@ -0,0 +1,303 @@
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+import Test
+
+# -------------- Config --------------
+# Discrete actions as (input_dir, jump_pressed, shrink_pressed, up, down),
+# following the real key bindings: Space jumps, W/Up jumps and climbs,
+# S/Down shrinks and climbs down. Each is offered walking left, standing
+# and walking right.
+ACTIONS = np.array([
+    (input_dir, jump, shrink, up, down)
+    for input_dir in (-1, 0, 1)
+    for jump, shrink, up, down in (
+        (False, False, False, False),  # walk
+        (True, False, False, False),  # Space
+        (True, False, True, False),  # W / Up
+        (False, True, False, True),  # S / Down
+    )
+], dtype=object)
+
+CROP_SHAPE = (11, 15)  # tile rows, cols of the map crop centred on the player
+OUTSIDE_TILE = 255  # crop value for cells past the edge of the map
+PLAYER_FEATURES = (
+    "x", "y", "vel_x", "vel_y", "flag_dx", "flag_dy", "health", "invulnerable", "on_ground", "on_ladder",
+    "is_small", "shrink_timer", "can_double_jump", "has_double_jump", "can_shrink", "facing",
+)
+
+PROGRESS_REWARD = 0.1  # per tile closer to the nearest flag
+HEALTH_REWARD = 0.01  # per health point gained, negative when lost
+FLAG_REWARD = 10.0
+MAX_EPISODE_STEPS = 60 * Test.SIM_RATE
+
+
+# -------------- Vector env --------------
+def touching(left, top, right, bottom, boxes):
+    # colliderect() for every (player, box) pair. The player edges are (n, 1)
+    # columns and boxes (k, 4) left, top, right, bottom rows, or (n, k, 4)
+    # when every player has its own boxes; returns an (n, k) bool matrix.
+    return ((boxes[..., 0] < right) & (boxes[..., 2] > left) &
+            (boxes[..., 1] < bottom) & (boxes[..., 3] > top))
+
+
+def box_array(rects):
+    return np.array([(r.left, r.top, r.right, r.bottom) for r in rects], dtype=float).reshape(-1, 4)
+
+
+class VectorEnv:
+    # num_envs independent copies of one level stepped together, gym style:
+    # reset() -> (obs, info) and step(actions) -> (obs, rewards, terminated,
+    # truncated, info), no display needed. Players step one by one with the
+    # real Player.update; enemies, shooters, projectiles and every contact
+    # test run as array operations over all copies at once, following the
+    # rules of World.step. Episodes end at a flag (terminated, success),
+    # on death (terminated) or after max_steps (truncated), and finished
+    # copies are reset straight away: their observation is the new start.
+    def __init__(self, num_envs, level_num=1, level_map=None, dt=Test.HEADLESS_DT, crop=CROP_SHAPE,
+                 max_steps=MAX_EPISODE_STEPS):
+        n = num_envs
+        self.num_envs = n
+        self.dt = dt
+        self.max_steps = max_steps
+        # Shared by every copy: nothing in it changes during play since
+        # shooter timers live in self.shoot_timer
+        level = self.level = Test.build_level(level_num, level_map)
+        self.action_count = len(ACTIONS)
+
+        self.players = [Test.Player(level.player_start) for _ in range(n)]
+        self.spawn_protect = np.zeros(n)
+        self.steps = np.zeros(n, dtype=np.int64)
+
+        # Copy i owns enemy rows i * E:(i + 1) * E and projectile slots
+        # i * capacity:(i + 1) * capacity
+        self.start_enemies = Test.EnemyBatch(level.enemies)
+        self.enemies = Test.EnemyBatch(level.enemies * n)
+        self.enemy_pos = self.enemies.pos.reshape(n, -1, 2)
+        self.enemy_direction = self.enemies.direction.reshape(n, -1)
+        capacity = Test.PROJECTILE_POOL_SIZE
+        self.capacity = capacity
+        self.projectiles = Test.ProjectileSystem(n * capacity)
+        self.pools = [self.projectiles.view(i * capacity, (i + 1) * capacity) for i in range(n)]
+
+        self.shooter_boxes = box_array(s.rect for s in level.shooters)
+        self.shooter_center = np.array([s.rect.center for s in level.shooters], dtype=float).reshape(-1, 2)
+        self.shooter_direction = [s.direction for s in level.shooters]
+        self.shoot_interval = np.array([s.shoot_interval for s in level.shooters], dtype=float)
+        self.shoot_timer = np.zeros((n, len(level.shooters)))
+        self.powerup_boxes = box_array(p.rect for p in level.powerups)
+        self.powerup_types = [p.type for p in level.powerups]
+        self.powerups = np.ones((n, len(level.powerups)), dtype=bool)  # not yet picked up
+        self.spike_boxes = box_array(s.rect for s in level.spikes)
+        self.flag_boxes = box_array(f.rect for f in level.flags)
+        self.flag_center = np.array([f.rect.center for f in level.flags], dtype=float).reshape(-1, 2)
+
+        # Crops are windows into the map padded by half a crop on each side
+        self.crop = crop
+        pad_y, pad_x = crop[0] // 2, crop[1] // 2
+        padded = np.pad(level.tiles, ((pad_y, crop[0] - pad_y), (pad_x, crop[1] - pad_x)),
+                        constant_values=OUTSIDE_TILE)
+        self.windows = np.lib.stride_tricks.sliding_window_view(padded, crop)
+
+        self.obs = {
+            "tiles": np.zeros((n, *crop), dtype=np.uint8),
+            "player": np.zeros((n, len(PLAYER_FEATURES)), dtype=np.float32),
+        }
+        self.flag_distance = np.zeros(n)
+        self.health = np.zeros(n)
+        self.reset()
+
+    def reset(self, seed=None):
+        # seed is accepted for API compatibility; the game has no randomness
+        self.reset_envs(np.arange(self.num_envs))
+        return self.observe(), {}
+
+    def reset_envs(self, envs):
+        level = self.level
+        for i in envs.tolist():
+            self.players[i] = Test.Player(level.player_start)
+            self.pools[i].clear()
+        self.enemy_pos[envs] = self.start_enemies.pos
+        self.enemy_direction[envs] = self.start_enemies.direction
+        self.shoot_timer[envs] = 0
+        self.powerups[envs] = True
+        self.spawn_protect[envs] = 0.15
+        self.steps[envs] = 0
+        self.flag_distance[envs] = self.distance_to_flag(self.player_boxes()[envs])
+        self.health[envs] = [self.players[i].health for i in envs.tolist()]
+
+    def player_boxes(self):
+        return box_array(p.rect for p in self.players)
+
+    def distance_to_flag(self, boxes):
+        # Manhattan distance in tiles from each player's center to its nearest flag
+        if not len(self.flag_center):
+            return np.zeros(len(boxes))
+        center = (boxes[:, :2] + boxes[:, 2:]) / 2
+        return np.abs(center[:, None, :] - self.flag_center).sum(axis=2).min(axis=1) / Test.TILE_SIZE
+
+    def step(self, actions):
+        dt = self.dt
+        n = self.num_envs
+        level = self.level
+        players = self.players
+        before = self.player_boxes()
+        controls = ACTIONS[np.asarray(actions)]
+        for player, (input_dir, jump, shrink, up, down) in zip(players, controls.tolist()):
+            player.update(dt, level, input_dir, jump, shrink, up, down)
+        protect = self.spawn_protect
+        np.subtract(protect, dt, out=protect, where=protect > 0)
+        self.steps += 1
+
+        self.enemies.update(dt)
+        if self.shoot_timer.size:
+            self.shoot_timer += dt
+            fire = self.shoot_timer >= self.shoot_interval
+            if fire.any():
+                self.shoot_timer[fire] = 0
+                for i, k in np.argwhere(fire).tolist():
+                    x, y = self.shooter_center[k]
+                    self.pools[i].spawn(x, y, self.shooter_direction[k])
+        projectiles = self.projectiles
+        projectiles.update(dt)
+
+        boxes = self.player_boxes()
+        left, top, right, bottom = (boxes[:, k:k + 1] for k in range(4))
+
+        picked = touching(left, top, right, bottom, self.powerup_boxes) & self.powerups & (protect <= 0)[:, None]
+        if picked.any():
+            for i, k in np.argwhere(picked).tolist():
+                player = players[i]
+                kind = self.powerup_types[k]
+                if kind == "double":
+                    player.can_double_jump = True
+                elif kind == "shrink":
+                    player.can_shrink = True
+                elif kind == "health":
+                    player.health = min(player.max_health, player.health + 30)  # heal 30 HP
+            self.powerups &= ~picked
+
+        w, h = Test.ENEMY_SIZE
+        pos = self.enemy_pos
+        hit_enemy = touching(left, top, right, bottom, np.concatenate((pos, pos + (w, h)), axis=2))
+        hit_shooter = touching(left, top, right, bottom, self.shooter_boxes)
+        hit_spike = touching(left, top, right, bottom, self.spike_boxes)
+
+        # Swept projectile hits for the live slots, each against its own
+        # copy's player and that player's movement this step
+        cap = self.capacity
+        slots = np.flatnonzero(projectiles.alive)
+        hit_slots = slots
+        if len(slots):
+            owner = slots // cap
+            d = projectiles.vel[slots] * dt - (boxes[owner, :2] - before[owner, :2])
+            lo = boxes[owner, :2] - Test.PROJECTILE_SIZE
+            hit_slots = slots[Test.swept_hits(projectiles.pos[slots] - d, d, lo, boxes[owner, 2:])]
+        hit_projectile = np.zeros(n, dtype=bool)
+        hit_projectile[hit_slots // cap] = True
+
+        # Damage in World.step's order; the first hit that lands makes the
+        # player invulnerable to the rest
+        hurt = hit_enemy.any(axis=1) | hit_shooter.any(axis=1) | hit_spike.any(axis=1) | hit_projectile
+        for i in np.flatnonzero(hurt).tolist():
+            player = players[i]
+            rect = player.rect
+            if hit_enemy[i].any():
+                k = int(hit_enemy[i].argmax())
+                knock_dir = 1 if rect.centerx < pos[i, k, 0] + w // 2 else -1
+                player.take_damage(20, (-knock_dir * 300, -400))
+            for k in np.flatnonzero(hit_shooter[i]).tolist():
+                knock_dir = 1 if rect.centerx < level.shooters[k].rect.centerx else -1
+                player.take_damage(10, (-knock_dir * 300, -400))
+            if hit_spike[i].any():
+                player.take_damage(20, (0, -400))
+            if hit_projectile[i]:
+                # The oldest shot is the one that lands
+                mine = hit_slots[hit_slots // cap == i] - i * cap
+                pool = self.pools[i]
+                first = mine[pool.age[mine].argmax()]
+                player.take_damage(10, (300 if pool.direction[first] < 0 else -300, -400))
+
+        if len(slots):
+            terrain = level.tiles if Test.PROJECTILES_HIT_TERRAIN else None
+            gone = projectiles.expired(level.world_w, level.world_h, terrain, dt)
+            gone[hit_slots] = True
+            for i in np.unique(np.flatnonzero(gone) // cap).tolist():
+                self.pools[i].remove(gone[i * cap:(i + 1) * cap])
+
+        # Rewards, then episode ends
+        reached = touching(left, top, right, bottom, self.flag_boxes).any(axis=1)
+        distance = self.distance_to_flag(boxes)
+        health = np.array([p.health for p in players], dtype=float)
+        rewards = ((self.flag_distance - distance) * PROGRESS_REWARD + (health - self.health) * HEALTH_REWARD +
+                   reached * FLAG_REWARD)
+        self.flag_distance = distance
+        self.health = health
+        terminated = reached | (health <= 0)
+        truncated = (self.steps >= self.max_steps) & ~terminated
+        info = {"level_complete": reached, "episode_steps": self.steps.copy()}
+        done = np.flatnonzero(terminated | truncated)
+        if len(done):
+            self.reset_envs(done)
+        return self.observe(), rewards, terminated, truncated, info
+
+    def observe(self):
+        # Fills and returns self.obs, so copy anything kept across steps
+        players = self.players
+        tile = Test.TILE_SIZE
+        center = np.array([p.rect.center for p in players]).reshape(-1, 2)
+        ty = np.clip(center[:, 1] // tile, 0, self.windows.shape[0] - 1)
+        tx = np.clip(center[:, 0] // tile, 0, self.windows.shape[1] - 1)
+        self.obs["tiles"][:] = self.windows[ty, tx]
+
+        flag = self.nearest_flag(center)
+        self.obs["player"][:] = [
+            (p.rect.x / tile, p.rect.y / tile, p.vel.x / tile, p.vel.y / tile, fx, fy,
+             p.health / p.max_health, p.invuln_timer > 0, p.on_ground, p.is_colliding_ladder, p.is_small,
+             p.shrink_timer, p.can_double_jump, p.has_double_jump, p.can_shrink, p.facing)
+            for p, (fx, fy) in zip(players, flag.tolist())
+        ]
+        return self.obs
+
+    def nearest_flag(self, points):
+        # Tile offset from each point to its nearest flag, zeros if there is none
+        if not len(self.flag_center):
+            return np.zeros((len(points), 2))
+        offset = self.flag_center - points[:, None, :]
+        nearest = np.abs(offset).sum(axis=2).argmin(axis=1)
+        return offset[np.arange(len(points)), nearest] / Test.TILE_SIZE
+
+
+# -------------- Main --------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step many headless copies of a level with random actions")
+    parser.add_argument("--envs", type=int, default=64, help="copies stepped together")
+    parser.add_argument("--steps", type=int, default=1000, help="batched steps to run")
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    env = VectorEnv(args.envs, args.level)
+    rng = np.random.default_rng(args.seed)
+    actions = rng.integers(env.action_count, size=(args.steps, args.envs))
+    env.reset()
+    episodes = flags = 0
+    start = time.perf_counter()
+    for batch in actions:
+        _, _, terminated, truncated, info = env.step(batch)
+        episodes += int((terminated | truncated).sum())
+        flags += int(info["level_complete"].sum())
+    elapsed = time.perf_counter() - start
+    total = args.steps * args.envs
+    print(f"{total} env steps in {elapsed:.3f} s: {total / elapsed:.0f} steps/s, "
+          f"{episodes} episodes finished, {flags} reached a flag")
+
+
+if __name__ == "__main__":
+    sys.exit(main())